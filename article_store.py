@@ -0,0 +1,366 @@
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import log_utils
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scraped_articles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    link TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    scraped_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scraped_articles_status ON scraped_articles (status, id);
+CREATE TABLE IF NOT EXISTS rewritten_articles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scraped_id INTEGER UNIQUE REFERENCES scraped_articles (id),
+    link TEXT,
+    data TEXT NOT NULL,
+    rewritten_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    source_url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    media_id INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_sha256 ON media (sha256);
+CREATE TABLE IF NOT EXISTS posting_ledger (
+    post_key TEXT PRIMARY KEY,
+    rewritten_id INTEGER NOT NULL REFERENCES rewritten_articles (id),
+    status TEXT NOT NULL DEFAULT 'pending',
+    wp_post_id INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posting_ledger_status ON posting_ledger (status, rewritten_id);
+"""
+
+STATUS_PENDING = 'pending'
+STATUS_REWRITTEN = 'rewritten'
+# Near-duplicate of an article already stored (see dedup.py)
+STATUS_DUPLICATE = 'duplicate'
+
+POST_PENDING = 'pending'
+POST_PUBLISHED = 'published'
+POST_FAILED = 'failed'
+# Failed permanently or too often; never picked up again on its own
+POST_DEAD = 'dead'
+# Claimed by a worker that is creating it right now
+POST_PUBLISHING = 'publishing'
+# Was being created when the process stopped, or WordPress gave an answer
+# that leaves it unknown, so it may already exist there; left alone until
+# requeued
+POST_UNCERTAIN = 'uncertain'
+
+
+def post_key(article):
+    """Identify a post by its source link, or by a hash of its text when it has none."""
+    if article.get('link'):
+        return article['link']
+    text = f"{article.get('title', '')}\n{article.get('full_text', '')}"
+    return 'sha256:' + hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ArticleStore:
+    """SQLite-backed store of scraped articles with a unique index on link.
+
+    Inserts are O(1) per article regardless of history size, and every
+    write runs in a transaction so a crash can never leave a truncated file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.DATABASE_PATH
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def add_articles(self, articles):
+        """Insert new articles, skipping links already stored. Returns the insert count."""
+        return len(self.insert_articles(articles))
+
+    def insert_articles(self, articles):
+        """Insert new articles and return (id, article) pairs for the ones actually added."""
+        now = time.time()
+        inserted = []
+        with self._lock, self.conn:
+            for article in articles:
+                if not article.get('link'):
+                    continue
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO scraped_articles (link, data, scraped_at) VALUES (?, ?, ?)',
+                    (article['link'], json.dumps(article, ensure_ascii=False), now))
+                if cursor.rowcount:
+                    inserted.append((cursor.lastrowid, article))
+        return inserted
+
+    def has_link(self, link):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM scraped_articles WHERE link = ?', (link,)).fetchone()
+        return row is not None
+
+    def pending_articles(self, limit=None):
+        """Return (id, article) pairs waiting to be rewritten, oldest first."""
+        query = 'SELECT id, data FROM scraped_articles WHERE status = ? ORDER BY id'
+        params = [STATUS_PENDING]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [(row_id, json.loads(data)) for row_id, data in rows]
+
+    def set_status(self, article_ids, status):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'UPDATE scraped_articles SET status = ? WHERE id = ?',
+                [(status, article_id) for article_id in article_ids])
+
+    def add_rewritten(self, scraped_id, article):
+        """Store one rewritten post, queue it for posting and mark its source, in one transaction.
+
+        Returns the id of the rewritten post, or None if it was already stored
+        or a post with the same identity is already in the posting ledger.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO rewritten_articles (scraped_id, link, data, rewritten_at) '
+                'VALUES (?, ?, ?, ?)',
+                (scraped_id, article.get('link'), json.dumps(article, ensure_ascii=False), now))
+            self.conn.execute(
+                'UPDATE scraped_articles SET status = ? WHERE id = ?', (STATUS_REWRITTEN, scraped_id))
+            if not cursor.rowcount:
+                return None
+            post_id = cursor.lastrowid
+            queued = self.conn.execute(
+                'INSERT OR IGNORE INTO posting_ledger (post_key, rewritten_id, updated_at) VALUES (?, ?, ?)',
+                (post_key(article), post_id, now)).rowcount
+            return post_id if queued else None
+
+    def rewritten_articles(self, after_id=0, limit=None):
+        """Return (id, article) pairs of rewritten posts with an id above `after_id`."""
+        query = 'SELECT id, data FROM rewritten_articles WHERE id > ? ORDER BY id'
+        params = [after_id]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [(row_id, json.loads(data)) for row_id, data in rows]
+
+    def unpublished_posts(self, limit=None):
+        """Return (id, post) pairs of rewritten posts still waiting to be posted, oldest first.
+
+        Reads only the pending and failed rows of the posting ledger, so the
+        cost follows the backlog rather than the size of the archive. Dead
+        posts are left out.
+        """
+        query = ('SELECT r.id, r.data FROM posting_ledger l '
+                 'JOIN rewritten_articles r ON r.id = l.rewritten_id '
+                 'WHERE l.status IN (?, ?) ORDER BY l.rewritten_id')
+        params = [POST_PENDING, POST_FAILED]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [(row_id, json.loads(data)) for row_id, data in rows]
+
+    def claim_post(self, post_id):
+        """Mark a pending or failed post as being published. Returns False if it is not up for posting."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'UPDATE posting_ledger SET status = ?, updated_at = ? WHERE rewritten_id = ? AND status IN (?, ?)',
+                (POST_PUBLISHING, time.time(), post_id, POST_PENDING, POST_FAILED))
+        return cursor.rowcount == 1
+
+    def release_claims(self, post_ids):
+        """Put claimed posts that were never sent back to pending."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'UPDATE posting_ledger SET status = ?, updated_at = ? WHERE rewritten_id = ? AND status = ?',
+                [(POST_PENDING, time.time(), post_id, POST_PUBLISHING) for post_id in post_ids])
+
+    def recover_interrupted(self):
+        """Mark posts left mid-publish by a stopped process as uncertain. Returns how many."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'UPDATE posting_ledger SET status = ?, updated_at = ? WHERE status = ?',
+                (POST_UNCERTAIN, time.time(), POST_PUBLISHING))
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} posts were being published when the last run stopped; "
+                           f"check WordPress for them, then run 'python article_store.py requeue'")
+        return cursor.rowcount
+
+    def requeue(self, statuses=(POST_UNCERTAIN, POST_DEAD)):
+        """Put posts in the given ledger statuses back to pending. Returns how many."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                f"UPDATE posting_ledger SET status = ?, attempts = 0, updated_at = ? "
+                f"WHERE status IN ({', '.join('?' * len(statuses))})",
+                (POST_PENDING, time.time(), *statuses))
+        return cursor.rowcount
+
+    def mark_published(self, post_id, wp_post_id):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE posting_ledger SET status = ?, wp_post_id = ?, attempts = attempts + 1, updated_at = ? '
+                'WHERE rewritten_id = ?', (POST_PUBLISHED, wp_post_id, time.time(), post_id))
+
+    def mark_failed(self, post_id, permanent=False, max_failures=Config.PUBLISH_MAX_FAILURES):
+        """Record a failed round of attempts. Returns True if the post is now dead.
+
+        A post is dead after a permanent failure or its `max_failures`th failure.
+        """
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE posting_ledger SET status = CASE WHEN ? OR attempts + 1 >= ? THEN ? ELSE ? END, '
+                'attempts = attempts + 1, updated_at = ? WHERE rewritten_id = ?',
+                (permanent, max_failures, POST_DEAD, POST_FAILED, time.time(), post_id))
+            row = self.conn.execute(
+                'SELECT status FROM posting_ledger WHERE rewritten_id = ?', (post_id,)).fetchone()
+        return row is not None and row[0] == POST_DEAD
+
+    def mark_uncertain(self, post_id):
+        """Record a post that may have been created in WordPress without us learning its id."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE posting_ledger SET status = ?, attempts = attempts + 1, updated_at = ? '
+                'WHERE rewritten_id = ?', (POST_UNCERTAIN, time.time(), post_id))
+
+    def media_for_url(self, source_url):
+        """Return the WordPress media id already uploaded for an image URL, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT media_id FROM media WHERE source_url = ?', (source_url,)).fetchone()
+        return row[0] if row else None
+
+    def media_for_hash(self, sha256):
+        """Return the WordPress media id of an image with this content hash, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT media_id FROM media WHERE sha256 = ? LIMIT 1', (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def add_media(self, source_url, sha256, media_id):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO media (source_url, sha256, media_id, uploaded_at) '
+                'VALUES (?, ?, ?, ?)', (source_url, sha256, media_id, time.time()))
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of a legacy scraped_data.json list."""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            articles = json.load(f)
+        inserted = self.add_articles(articles)
+        logger.info(f"Migrated {inserted} of {len(articles)} articles from {json_path} to {self.path}")
+        return inserted
+
+    def migrate_rewritten_from_json(self, json_path):
+        """One-shot import of a legacy rewritten_blogs.json list into an empty table.
+
+        Each post keeps its list position as its id (position + 1), which is
+        what migrate_ledger relies on. Later copies of a post already in the
+        list (same link, or same text without one) are skipped.
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            articles = json.load(f)
+        now = time.time()
+        seen = set()
+        rows = []
+        for position, article in enumerate(articles):
+            key = post_key(article)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append((position + 1, article.get('link'), json.dumps(article, ensure_ascii=False), now))
+        with self._lock, self.conn:
+            if self.conn.execute('SELECT 1 FROM rewritten_articles LIMIT 1').fetchone():
+                raise ValueError(f"rewritten_articles in {self.path} is not empty; "
+                                 f"refusing to import {json_path} again")
+            inserted = self.conn.executemany(
+                'INSERT OR IGNORE INTO rewritten_articles (id, link, data, rewritten_at) VALUES (?, ?, ?, ?)',
+                rows).rowcount
+        logger.info(f"Migrated {inserted} of {len(articles)} rewritten posts from {json_path} to {self.path}")
+        return inserted
+
+    def migrate_ledger(self, index_path='last_posted_index.txt'):
+        """One-shot fill of the posting ledger from rewritten posts and the legacy index file.
+
+        Posts up to last_posted_index are recorded as published, the rest as pending.
+        """
+        try:
+            with open(index_path, 'r') as f:
+                last_posted_index = int(f.read().strip())
+        except FileNotFoundError:
+            last_posted_index = -1
+        now = time.time()
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                'SELECT r.id, r.data FROM rewritten_articles r '
+                'LEFT JOIN posting_ledger l ON l.rewritten_id = r.id '
+                'WHERE l.rewritten_id IS NULL ORDER BY r.id').fetchall()
+            # Rewritten post ids start at 1, so post id - 1 is the legacy index
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO posting_ledger (post_key, rewritten_id, status, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                [(post_key(json.loads(data)), row_id,
+                  POST_PUBLISHED if row_id - 1 <= last_posted_index else POST_PENDING, now)
+                 for row_id, data in rows])
+        logger.info(f"Added {len(rows)} rewritten posts to the posting ledger "
+                    f"(posted up to index {last_posted_index})")
+        return len(rows)
+
+
+def main():
+    log_utils.setup_logging()
+    parser = argparse.ArgumentParser(description='Manage the scraped article store')
+    parser.add_argument('--database', default=Config.DATABASE_PATH, help='SQLite database file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help='Import a legacy scraped_data.json file')
+    migrate.add_argument('json_file', nargs='?', default='scraped_data.json')
+    migrate_rewritten = subparsers.add_parser('migrate-rewritten',
+                                              help='Import a legacy rewritten_blogs.json file')
+    migrate_rewritten.add_argument('json_file', nargs='?', default='rewritten_blogs.json')
+    migrate_ledger = subparsers.add_parser('migrate-ledger',
+                                           help='Fill the posting ledger from a legacy last_posted_index.txt')
+    migrate_ledger.add_argument('index_file', nargs='?', default='last_posted_index.txt')
+    requeue = subparsers.add_parser('requeue', help='Queue uncertain and dead posts for posting again')
+    requeue.add_argument('--status', nargs='+', choices=[POST_UNCERTAIN, POST_DEAD],
+                         default=[POST_UNCERTAIN, POST_DEAD])
+    args = parser.parse_args()
+
+    store = ArticleStore(args.database)
+    try:
+        if args.command == 'migrate':
+            store.migrate_from_json(args.json_file)
+        elif args.command == 'migrate-rewritten':
+            store.migrate_rewritten_from_json(args.json_file)
+        elif args.command == 'migrate-ledger':
+            store.migrate_ledger(args.index_file)
+        elif args.command == 'requeue':
+            logger.info(f"Requeued {store.requeue(args.status)} posts")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import glob
+import json
+import logging
+import os
+import time
+from chat_request import get_client, MODEL, RESPONSE_FORMAT
+from blog_rewriter import (
+    plan_rewrite_requests, assemble_rewrite, parse_response,
+    make_rewritten_blog, response_cache
+)
+from config_rewriter import (
+    BATCH_DIR, BATCH_POLL_INTERVAL, BATCH_COMPLETION_WINDOW, BATCH_TIMEOUT,
+    BATCH_MAX_REQUESTS, BATCH_MAX_BYTES
+)
+from response_cache import ResponseCache
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def rewrite_blog_posts_batch(blogs, client=None, poll_interval=BATCH_POLL_INTERVAL, on_rewritten=None):
+    """Rewrite blog posts through the OpenAI Batch API.
+
+    Returns the same (rewritten_blogs, processed_indices) pair as
+    blog_rewriter.rewrite_blog_posts and calls `on_rewritten` the same way.
+    Responses already in the response cache are not sent again, and
+    batches submitted by an interrupted run are waited for first.
+    """
+    client = client or get_client()
+
+    # Each request's custom_id is its response cache key, so results of a
+    # resumed batch still match the prompts they answer
+    responses = resume_batches(client, poll_interval)
+    plans = {}
+    pending_lines = {}
+    for i, blog in enumerate(blogs):
+        if 'full_text' not in blog or not blog['full_text']:
+            logging.error(f"Error rewriting blog post {i+1}: Blog post {i+1} has no content")
+            continue
+        requests = plan_rewrite_requests(blog['title'], blog['full_text'])
+        plans[i] = requests
+        for prompt, _, _ in requests:
+            custom_id = ResponseCache.make_key(MODEL, prompt, RESPONSE_FORMAT)
+            if custom_id in responses or custom_id in pending_lines:
+                continue
+            cached = response_cache.get(custom_id)
+            if cached is not None:
+                responses[custom_id] = cached
+                continue
+            pending_lines[custom_id] = json.dumps({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': {
+                    'model': MODEL,
+                    'messages': [{'role': 'user', 'content': prompt}],
+                    'response_format': RESPONSE_FORMAT,
+                },
+            }, ensure_ascii=False)
+
+    if pending_lines:
+        responses.update(run_batches(client, list(pending_lines.values()), poll_interval))
+
+    rewritten_blogs = []
+    processed_indices = []
+    for i, requests in plans.items():
+        try:
+            results = []
+            for prompt, required_keys, label in requests:
+                key = ResponseCache.make_key(MODEL, prompt, RESPONSE_FORMAT)
+                response = responses.get(key)
+                if response is None:
+                    raise ValueError(f"Batch returned no response for {label}")
+                results.append(parse_response(response, required_keys, label))
+                response_cache.set(key, response)
+            rewritten_blog = make_rewritten_blog(blogs[i], assemble_rewrite(requests, results))
+            if on_rewritten:
+                on_rewritten(i, rewritten_blog)
+            rewritten_blogs.append(rewritten_blog)
+            processed_indices.append(i)
+            logging.info(f"Successfully rewrote blog post {i+1}")
+        except ValueError as ve:
+            logging.error(f"Error rewriting blog post {i+1}: {str(ve)}")
+        except Exception as e:
+            logging.error(f"Unexpected error rewriting blog post {i+1}: {str(e)}")
+
+    return rewritten_blogs, processed_indices
+
+
+def split_lines(lines, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES):
+    """Group JSONL request lines into batches within the request count and file size limits."""
+    groups = []
+    current = []
+    size = 0
+    for line in lines:
+        line_size = len(line.encode('utf-8')) + 1
+        if current and (len(current) == max_requests or size + line_size > max_bytes):
+            groups.append(current)
+            current = []
+            size = 0
+        current.append(line)
+        size += line_size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def run_batches(client, lines, poll_interval):
+    """Submit JSONL request lines in as many batches as needed and return {custom_id: content}."""
+    manifests = [submit_batch(client, group) for group in split_lines(lines)]
+    responses = {}
+    for manifest in manifests:
+        responses.update(wait_for_batch(client, manifest, poll_interval))
+    return responses
+
+
+def resume_batches(client, poll_interval):
+    """Wait for batches a previous run submitted but never collected. Returns {custom_id: content}."""
+    responses = {}
+    for manifest_path in sorted(glob.glob(os.path.join(BATCH_DIR, '*.manifest.json'))):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        logging.info(f"Resuming batch {manifest['batch_id']} submitted from {manifest['input_path']}")
+        responses.update(wait_for_batch(client, manifest, poll_interval))
+    return responses
+
+
+def _manifest_path(batch_id):
+    return os.path.join(BATCH_DIR, f"{batch_id}.manifest.json")
+
+
+def _forget_batch(manifest):
+    # The batch has ended, so neither its manifest nor its input is needed again
+    os.remove(_manifest_path(manifest['batch_id']))
+    try:
+        os.remove(manifest['input_path'])
+    except FileNotFoundError:
+        pass
+
+
+def submit_batch(client, lines):
+    """Upload one batch and record it in BATCH_DIR so a restarted run can collect it."""
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    input_path = os.path.join(BATCH_DIR, f"batch-{time.time_ns()}.jsonl")
+    with open(input_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    with open(input_path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose='batch')
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+    manifest = {
+        'batch_id': batch.id,
+        'input_path': input_path,
+        'requests': len(lines),
+        'submitted_at': time.time(),
+    }
+    # Write beside the target and swap, so a crash never leaves half a manifest
+    manifest_path = _manifest_path(batch.id)
+    with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    logging.info(f"Submitted batch {batch.id} with {len(lines)} requests from {input_path}")
+    return manifest
+
+
+def wait_for_batch(client, manifest, poll_interval, timeout=BATCH_TIMEOUT):
+    """Poll a batch until it ends or `timeout` seconds after submission, then return {custom_id: content}.
+
+    A batch still running at the deadline is cancelled. Its manifest and
+    input file are removed once the batch has ended either way; if
+    polling raises, they stay and the next run resumes the batch.
+    """
+    batch_id = manifest['batch_id']
+    deadline = manifest['submitted_at'] + timeout
+    batch = client.batches.retrieve(batch_id)
+    while batch.status not in FINAL_STATUSES:
+        if time.time() >= deadline:
+            logging.error(f"Batch {batch_id} still {batch.status} after {timeout}s, cancelling it")
+            try:
+                client.batches.cancel(batch_id)
+            except Exception as e:
+                logging.error(f"Could not cancel batch {batch_id}: {str(e)}")
+            _forget_batch(manifest)
+            return {}
+        time.sleep(max(0, min(poll_interval, deadline - time.time())))
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            logging.info(f"Batch {batch_id} is {batch.status}: "
+                         f"{counts.completed}/{counts.total} completed, {counts.failed} failed")
+
+    if batch.status != 'completed':
+        logging.error(f"Batch {batch_id} ended with status {batch.status}")
+    responses = read_batch_output(client, batch) if batch.output_file_id else {}
+    if batch.error_file_id:
+        log_batch_errors(client, batch)
+    _forget_batch(manifest)
+    return responses
+
+
+def _log_failed_request(result):
+    response = result.get('response') or {}
+    logging.error(f"Batch request {result.get('custom_id')} failed: "
+                  f"{result.get('error') or response.get('body')}")
+
+
+def read_batch_output(client, batch):
+    responses = {}
+    output = client.files.content(batch.output_file_id).text
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get('response') or {}
+        if result.get('error') or response.get('status_code') != 200:
+            _log_failed_request(result)
+            continue
+        content = response['body']['choices'][0]['message']['content']
+        if content:
+            responses[result['custom_id']] = content
+    return responses
+
+
+def log_batch_errors(client, batch):
+    """Log each request of the batch's error file, the ones that got no output line."""
+    errors = client.files.content(batch.error_file_id).text
+    for line in errors.splitlines():
+        if line.strip():
+            _log_failed_request(json.loads(line))
@@ -0,0 +1,126 @@
+"""Measure what featured image optimization saves in bytes and upload time.
+
+Uploads every image in --images through `upload_featured_image` to the
+local WordPress stand-in (stubs/wordpress_server.py), once as-is and once
+with IMAGE_OPTIMIZE on:
+
+    python benchmarks/bench_images.py --bandwidth 2000
+
+Put sample images (e.g. saved Karar/BBC featured images) in the images
+directory; when it is empty, synthetic photos are generated with Pillow.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_optimizer  # noqa: E402
+import wordpress_api  # noqa: E402
+from article_store import ArticleStore  # noqa: E402
+from config import Config  # noqa: E402
+from stubs import wordpress_server  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGES_DIR = os.path.join(BASE_DIR, 'images')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def generate_images(images_dir, count, width=3000, height=2000):
+    """Write `count` noisy gradient JPEGs, sized like a news photo straight from a CMS."""
+    from PIL import Image
+
+    os.makedirs(images_dir, exist_ok=True)
+    rng = random.Random(42)
+    for i in range(count):
+        image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        noise = Image.effect_noise((width, height), 40 + i * 5).convert('RGB')
+        tint = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        image = Image.blend(Image.blend(image, noise, 0.3), tint, 0.3)
+        image.save(os.path.join(images_dir, f"sample-{i}.jpg"), quality=95)
+    print(f"Generated {count} sample images in {images_dir}")
+
+
+def run_mode(images_dir, filenames, optimize, bandwidth, latency, concurrency):
+    Config.IMAGE_OPTIMIZE = optimize
+    wordpress = wordpress_server.make_server(port=0, latency=latency, upload_bandwidth=bandwidth)
+    files = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=images_dir))
+    Config.WORDPRESS_URL = serve(wordpress)
+    files_url = serve(files)
+    Config.WORDPRESS_USERNAME = Config.WORDPRESS_PASSWORD = 'bench'
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # A fresh media map, so every image is really uploaded
+            wordpress_api._media_store = ArticleStore(os.path.join(tmp, 'media.db'))
+            urls = [f"{files_url}/{filename}" for filename in filenames]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                media_ids = list(executor.map(wordpress_api.upload_featured_image, urls))
+            elapsed = time.perf_counter() - start
+            wordpress_api._media_store.close()
+            wordpress_api._media_store = None
+    finally:
+        wordpress.shutdown()
+        files.shutdown()
+
+    failures = media_ids.count(None)
+    return elapsed, wordpress.RequestHandlerClass.state.stats()['media_bytes'], failures
+
+
+def run_benchmark(images_dir, bandwidth, latency, concurrency):
+    filenames = sorted(name for name in os.listdir(images_dir)
+                       if os.path.isfile(os.path.join(images_dir, name)))
+    source_bytes = sum(os.path.getsize(os.path.join(images_dir, name)) for name in filenames)
+
+    # Start the worker processes up front so their spawn time is not measured
+    for future in [image_optimizer.get_executor().submit(abs, 0) for _ in range(Config.IMAGE_WORKERS)]:
+        future.result()
+
+    print(f"{len(filenames)} images, {source_bytes / 1e6:.2f} MB; max width {Config.IMAGE_MAX_WIDTH}, "
+          f"{Config.IMAGE_FORMAT} q{Config.IMAGE_QUALITY}, {Config.IMAGE_WORKERS} image workers")
+    print(f"{'mode':<10} {'uploaded MB':>12} {'saved':>7} {'seconds':>8} {'ms/image':>9}  failures")
+    for label, optimize in (('original', False), ('optimized', True)):
+        elapsed, uploaded, failures = run_mode(images_dir, filenames, optimize, bandwidth, latency, concurrency)
+        saved = 1 - uploaded / source_bytes if source_bytes else 0
+        print(f"{label:<10} {uploaded / 1e6:>12.2f} {saved:>6.1%} {elapsed:>8.2f} "
+              f"{elapsed * 1000 / len(filenames):>9.1f}  {failures}")
+
+
+def main():
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser(description='Benchmark featured image optimization')
+    parser.add_argument('--images', default=DEFAULT_IMAGES_DIR, help='Directory with sample images')
+    parser.add_argument('--generate', type=int, default=8,
+                        help='Synthetic images to create when the directory is empty')
+    parser.add_argument('--bandwidth', type=int, default=2000,
+                        help='Upload bandwidth of the stub WordPress in KB/s (0: unlimited)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub WordPress latency in seconds')
+    parser.add_argument('--concurrency', type=int, default=Config.PUBLISH_CONCURRENCY,
+                        help='Concurrent uploads')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.images) or not os.listdir(args.images):
+        generate_images(args.images, args.generate)
+    run_benchmark(args.images, args.bandwidth * 1000, args.latency, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
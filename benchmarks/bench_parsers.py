@@ -0,0 +1,162 @@
+"""Compare HTML parser backends on saved listing and article pages.
+
+Save a sample set once (this hits the live sites):
+
+    python benchmarks/bench_parsers.py --save
+
+then benchmark offline as often as needed:
+
+    python benchmarks/bench_parsers.py --repeat 20
+
+Every backend is checked against the reference `html.parser` full parse;
+a backend whose output differs is reported as MISMATCH.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import BlogScraper  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PAGES_DIR = os.path.join(BASE_DIR, 'pages')
+REPO_CONFIG = os.path.join(os.path.dirname(BASE_DIR), 'config.json')
+
+BACKENDS = [
+    ('html.parser', False),
+    ('html.parser', True),
+    ('lxml', False),
+    ('lxml', True),
+]
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def load_config():
+    with open(REPO_CONFIG, 'r') as f:
+        return json.load(f)
+
+
+def make_scraper(config, parser, parse_only):
+    config = dict(config, parser=parser)
+    config['websites'] = [dict(website, parse_only=parse_only) for website in config['websites']]
+    return BlogScraper(config=config)
+
+
+def save_pages(pages_dir, articles_per_site):
+    config = load_config()
+    scraper = make_scraper(config, 'html.parser', False)
+    manifest = {}
+    for website in config['websites']:
+        site_dir = os.path.join(pages_dir, slugify(website['name']))
+        os.makedirs(site_dir, exist_ok=True)
+
+        response = scraper.fetch(website['url'])
+        response.raise_for_status()
+        with open(os.path.join(site_dir, 'listing.html'), 'wb') as f:
+            f.write(response.content)
+
+        articles = []
+        links = []
+        for article in scraper.parse_listing(response.content, website)[:articles_per_site]:
+            article_data = scraper.extract_article_data(article, website)
+            if not article_data:
+                continue
+            page = scraper.fetch(article_data['link'])
+            if page.status_code != 200:
+                continue
+            filename = f"article-{len(articles)}.html"
+            with open(os.path.join(site_dir, filename), 'wb') as f:
+                f.write(page.content)
+            articles.append(filename)
+            links.append(article_data['link'])
+
+        # links lets benchmarks/bench_pipeline.py replay the pages from a local server
+        manifest[website['name']] = {'dir': slugify(website['name']), 'articles': articles,
+                                     'url': website['url'], 'links': links}
+        print(f"Saved listing and {len(articles)} articles for {website['name']}")
+
+    with open(os.path.join(pages_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def extract_all(scraper, pages):
+    results = []
+    for website, listing, articles in pages:
+        for article in scraper.parse_listing(listing, website):
+            results.append(scraper.extract_article_data(article, website))
+        for markup in articles:
+            results.append(scraper.extract_article_content(markup, website))
+    return results
+
+
+def load_pages(pages_dir, config):
+    with open(os.path.join(pages_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    pages = []
+    for website in config['websites']:
+        entry = manifest.get(website['name'])
+        if not entry:
+            continue
+        site_dir = os.path.join(pages_dir, entry['dir'])
+        with open(os.path.join(site_dir, 'listing.html'), 'rb') as f:
+            listing = f.read()
+        articles = []
+        for filename in entry['articles']:
+            with open(os.path.join(site_dir, filename), 'rb') as f:
+                articles.append(f.read())
+        pages.append((website, listing, articles))
+    return pages
+
+
+def run_benchmark(pages_dir, repeat):
+    config = load_config()
+    pages = load_pages(pages_dir, config)
+    page_count = sum(1 + len(articles) for _, _, articles in pages)
+
+    reference = None
+    print(f"{'backend':<14} {'parse_only':<11} {'ms/page':>9} {'speedup':>8}  output")
+    baseline_ms = None
+    for parser, parse_only in BACKENDS:
+        scraper = make_scraper(config, parser, parse_only)
+        if scraper.parser != parser:
+            print(f"{parser:<14} {str(parse_only):<11} {'skipped (not installed)':>20}")
+            continue
+
+        output = json.dumps(extract_all(scraper, pages), ensure_ascii=False)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            extract_all(scraper, pages)
+        ms_per_page = (time.perf_counter() - start) * 1000 / (repeat * page_count)
+
+        if reference is None:
+            reference, baseline_ms = output, ms_per_page
+        status = 'identical' if output == reference else 'MISMATCH'
+        print(f"{parser:<14} {str(parse_only):<11} {ms_per_page:>9.2f} "
+              f"{baseline_ms / ms_per_page:>7.2f}x  {status}")
+
+
+def main():
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser(description='Benchmark HTML parser backends for BlogScraper')
+    parser.add_argument('--pages', default=DEFAULT_PAGES_DIR, help='Directory with saved sample pages')
+    parser.add_argument('--save', action='store_true', help='Download fresh sample pages from the live sites')
+    parser.add_argument('--articles', type=int, default=5, help='Articles to save per site with --save')
+    parser.add_argument('--repeat', type=int, default=10, help='Benchmark iterations')
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.pages, args.articles)
+    else:
+        run_benchmark(args.pages, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+"""Offline benchmark of every pipeline stage against local stand-ins.
+
+Starts the stub servers in stubs/ as subprocesses (news sites, OpenAI,
+WordPress), runs the real scrape, dedup, rewrite and publish code against
+them, and reports throughput, p50/p99 latency per item and the peak
+RSS of each stage (reset between stages on Linux; elsewhere the process
+high-water mark so far):
+
+    python benchmarks/bench_pipeline.py --articles 30 --openai-latency 0.5 --openai-429-rate 0.05
+
+Listing and article pages are generated from the selectors in config.json.
+Pass --pages to replay pages saved with `bench_parsers.py --save` instead.
+Save a run with --output and check later runs against it with --baseline;
+the exit status is 1 when a stage got slower than --tolerance allows.
+
+--publish-mode batch publishes through the batch endpoint and checks the
+number of post requests WordPress received: one per WORDPRESS_BATCH_SIZE
+posts, or one refused batch plus one per post with --wordpress-no-batch.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from urllib.parse import urlsplit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+REPO_CONFIG = os.path.join(REPO_DIR, 'config.json')
+STAGES = ('scrape', 'dedup', 'rewrite', 'publish')
+
+_SELECTOR_PART = re.compile(
+    r"""^(?P<tag>[a-zA-Z][\w-]*)?(?P<classes>(?:\.[\w-]+)*)(?P<attrs>(?:\[[^\]]+\])*)$""")
+_SELECTOR_ATTR = re.compile(r"""\[([\w-]+)=["']?([^"'\]]*)["']?\]""")
+VOID_TAGS = {'img', 'br', 'hr', 'source'}
+SYLLABLES = ['ka', 'ra', 'ha', 'ber', 'te', 'le', 'yü', 'gö', 'rü', 'şi', 'çe', 'lı',
+             'dı', 'ğı', 'ön', 'ce', 'ay', 'kı', 'ye', 'ni', 'mar', 'sen', 'tü', 'rk']
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def element(selector, inner='', attributes=None):
+    """Build markup matched by a simple descendant selector such as `h2.title a`."""
+    markup = None
+    for part in reversed(selector.split()):
+        match = _SELECTOR_PART.match(part)
+        if not match:
+            raise ValueError(f"Cannot generate markup for selector {selector!r}")
+        tag = match.group('tag') or 'div'
+        attrs = {}
+        classes = [name for name in match.group('classes').split('.') if name]
+        if classes:
+            attrs['class'] = ' '.join(classes)
+        attrs.update(_SELECTOR_ATTR.findall(match.group('attrs')))
+        if markup is None:
+            attrs.update(attributes or {})
+            content = inner
+        else:
+            content = markup
+        attr_text = ''.join(f' {name}="{escape(value)}"' for name, value in attrs.items())
+        markup = f"<{tag}{attr_text}>" if tag in VOID_TAGS else f"<{tag}{attr_text}>{content}</{tag}>"
+    return markup
+
+
+def make_sentence(rng, words):
+    text = ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(words))
+    return text.capitalize()
+
+
+def make_image(rng, size=120 * 1024):
+    # JPEG magic bytes are enough for upload_featured_image's type sniffing
+    return b'\xff\xd8\xff\xe0' + rng.randbytes(size)
+
+
+def build_synthetic_site(root, websites, articles_per_site, rng):
+    """Write a listing and article pages for each site, shaped by its selectors."""
+    os.makedirs(os.path.join(root, 'img'), exist_ok=True)
+    paths = {}
+    for website in websites:
+        slug = slugify(website['name'])
+        os.makedirs(os.path.join(root, slug), exist_ok=True)
+        items = []
+        for i in range(articles_per_site):
+            link = f"/{slug}/article-{i}.html"
+            image = f"/img/{slug}-{i}.jpg"
+            title = f"{website['name']} {i}: {make_sentence(rng, 6)}"
+            with open(os.path.join(root, 'img', f"{slug}-{i}.jpg"), 'wb') as f:
+                f.write(make_image(rng))
+
+            if website['title_selector'] == website['link_selector']:
+                parts = [element(website['title_selector'], escape(title), {'href': link})]
+            else:
+                parts = [element(website['link_selector'], '', {'href': link}),
+                         element(website['title_selector'], escape(title))]
+            parts.append(element(website['image_selector'], attributes={'src': image}))
+            parts.append(element(website['date_selector'], '2024-01-01'))
+            items.append(element(website['article_selector'], ''.join(parts)))
+
+            paragraphs = ''.join(
+                element(website['text_content_selector'], f"<p>{make_sentence(rng, rng.randint(40, 80))}.</p>")
+                for _ in range(rng.randint(6, 12)))
+            tags = ''.join(element(website['tag_selector'], f"etiket {n}") for n in range(3))
+            # <main role="main"> is where the main_blocks content strategy looks
+            page = (f"<html><body><main role=\"main\">"
+                    f"{element(website['content_selector'], paragraphs + tags)}</main></body></html>")
+            with open(os.path.join(root, slug, f"article-{i}.html"), 'w', encoding='utf-8') as f:
+                f.write(page)
+
+        with open(os.path.join(root, slug, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(f"<html><body><div>{''.join(items)}</div></body></html>")
+        paths[website['name']] = f"/{slug}/index.html"
+    return paths
+
+
+def build_replay_site(root, pages_dir, websites, rng):
+    """Copy pages saved by bench_parsers.py, pointing listing links at the local copies."""
+    with open(os.path.join(pages_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    os.makedirs(os.path.join(root, 'img'), exist_ok=True)
+    paths = {}
+    for website in websites:
+        entry = manifest.get(website['name'])
+        if not entry:
+            continue
+        if 'links' not in entry:
+            raise SystemExit(f"{pages_dir} has no article links; save it again with bench_parsers.py --save")
+        site_dir = os.path.join(root, entry['dir'])
+        os.makedirs(site_dir, exist_ok=True)
+        with open(os.path.join(pages_dir, entry['dir'], 'listing.html'), 'rb') as f:
+            listing = f.read()
+        for filename, link in zip(entry['articles'], entry['links']):
+            with open(os.path.join(pages_dir, entry['dir'], filename), 'rb') as f:
+                page = f.read()
+            with open(os.path.join(site_dir, filename), 'wb') as f:
+                f.write(page)
+            local = f"/{entry['dir']}/{filename}".encode()
+            path = urlsplit(link).path
+            for original in (link, path):
+                listing = listing.replace(f'"{original}"'.encode(), b'"' + local + b'"')
+        with open(os.path.join(site_dir, 'index.html'), 'wb') as f:
+            f.write(listing)
+        paths[website['name']] = f"/{entry['dir']}/index.html"
+    # Featured images of replayed pages live on the real CDNs; publish_stage
+    # swaps in these local stand-ins
+    saved = sum(len(entry['articles']) for entry in manifest.values())
+    for i in range(1, saved + 1):
+        with open(os.path.join(root, 'img', f"replay-{i}.jpg"), 'wb') as f:
+            f.write(make_image(rng))
+    return paths
+
+
+def start_stub(module, *args):
+    process = subprocess.Popen([sys.executable, '-m', module, '--port', '0', *args],
+                               cwd=REPO_DIR, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    match = re.search(r'http://\S+', line)
+    if not match:
+        process.kill()
+        raise SystemExit(f"{module} did not start: {line!r}")
+    return process, match.group(0)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def reset_peak_rss():
+    """Restart the peak RSS counter (Linux only); returns False where that is not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # Process-wide high-water mark; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def measure(body):
+    """Call body() -> (outputs, latencies, errors) and collect timing and memory for the stage."""
+    reset_peak_rss()
+    start = time.perf_counter()
+    outputs, latencies, errors = body()
+    seconds = time.perf_counter() - start
+    stats = {
+        'items': len(latencies),
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds if seconds else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+        'errors': errors,
+    }
+    return outputs, stats
+
+
+def scrape_stage(config):
+    from scraper import BlogScraper
+
+    scraper = BlogScraper(config=config)
+    latencies = []
+    fetch_article_content = scraper.fetch_article_content
+
+    def timed_fetch(article_data, website):
+        start = time.perf_counter()
+        try:
+            return fetch_article_content(article_data, website)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    scraper.fetch_article_content = timed_fetch
+    try:
+        posts = scraper.scrape()
+    finally:
+        scraper.close()
+    # Articles whose page could not be read are left out of the result
+    return posts, latencies, len(latencies) - len(posts)
+
+
+def dedup_stage(posts, database):
+    from dedup import DuplicateIndex
+
+    index = DuplicateIndex(database)
+    latencies = []
+    unique = []
+    try:
+        for i, post in enumerate(posts, 1):
+            start = time.perf_counter()
+            duplicate = index.check(i, post)
+            latencies.append(time.perf_counter() - start)
+            if not duplicate:
+                unique.append(post)
+    finally:
+        index.close()
+    return unique, latencies, 0
+
+
+def map_timed(func, items, workers):
+    latencies = []
+
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            return func(item)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"{func.__name__} failed: {e}")
+            return None
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(timed, items))
+    return results, latencies
+
+
+def rewrite_stage(posts):
+    import blog_rewriter
+    from config_rewriter import MAX_CONCURRENT_POSTS
+
+    def rewrite(post):
+        return blog_rewriter.make_rewritten_blog(
+            post, blog_rewriter.rewrite_blog_post(post['title'], post['full_text']))
+
+    results, latencies = map_timed(rewrite, posts, MAX_CONCURRENT_POSTS)
+    rewritten = [post for post in results if post]
+    return rewritten, latencies, len(results) - len(rewritten)
+
+
+def publish_stage(posts, site_url, replay=False):
+    import blog_poster
+    from config import Config
+
+    if replay:
+        for i, post in enumerate(posts, 1):
+            post['image'] = f"{site_url}/img/replay-{i}.jpg"
+
+    def publish(item):
+        i, post = item
+        return blog_poster.publish_post(i, post)
+
+    results, latencies = map_timed(publish, list(enumerate(posts, 1)), Config.PUBLISH_CONCURRENCY)
+    return results, latencies, sum(1 for result in results if not result)
+
+
+def stub_stats(wordpress_url):
+    with urllib.request.urlopen(f"{wordpress_url}/stub/stats") as response:
+        return json.load(response)
+
+
+def bulk_publish_stage(posts, wordpress_url, batch_endpoint):
+    import blog_poster
+    from article_store import ArticleStore
+    from config import Config
+
+    store = ArticleStore()
+    try:
+        # publish_posts_bulk works from the posting ledger
+        pending = []
+        for article_id, post in store.insert_articles(posts):
+            post_id = store.add_rewritten(article_id, post)
+            if post_id is not None:
+                pending.append((post_id, post))
+        before = stub_stats(wordpress_url)
+        start = time.perf_counter()
+        published, failed = blog_poster.publish_posts_bulk(pending, store)
+        seconds = time.perf_counter() - start
+        after = stub_stats(wordpress_url)
+    finally:
+        store.close()
+
+    post_requests = (after['requests'] - before['requests']) - (after['media'] - before['media'])
+    if batch_endpoint:
+        expected = math.ceil(len(pending) / Config.WORDPRESS_BATCH_SIZE)
+    else:
+        expected = 1 + len(pending)
+    if post_requests != expected:
+        raise SystemExit(f"Publishing {len(pending)} posts took {post_requests} WordPress requests, "
+                         f"expected {expected}")
+    # A post counts as done when the bulk call returns
+    return published, [seconds] * len(pending), failed
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for stage, stats in results.items():
+        before = baseline.get(stage)
+        if not before:
+            continue
+        if before['throughput'] and stats['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{stage}: throughput {stats['throughput']:.2f}/s, "
+                               f"baseline {before['throughput']:.2f}/s")
+        if before['p99_ms'] and stats['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{stage}: p99 {stats['p99_ms']:.0f} ms, baseline {before['p99_ms']:.0f} ms")
+    return regressions
+
+
+def main():
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser(description='Benchmark the scrape -> rewrite -> publish pipeline offline')
+    parser.add_argument('--articles', type=int, default=20, help='Generated articles per site')
+    parser.add_argument('--pages', help='Replay pages saved by bench_parsers.py --save instead of generating them')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for generated pages')
+    parser.add_argument('--site-latency', type=float, default=0.05, help='Seconds per news site request')
+    parser.add_argument('--openai-latency', type=float, default=0.3, help='Seconds per chat completion')
+    parser.add_argument('--openai-429-rate', type=float, default=0.0,
+                        help='Share of chat completions answered with 429 (0-1)')
+    parser.add_argument('--wordpress-latency', type=float, default=0.05, help='Seconds per WordPress request')
+    parser.add_argument('--publish-mode', choices=['single', 'batch'], default='single',
+                        help='Publish one request per post, or through the batch endpoint with a request count check')
+    parser.add_argument('--wordpress-no-batch', action='store_true',
+                        help='Run the WordPress stub without the batch endpoint, like WordPress before 5.6')
+    parser.add_argument('--real-limits', action='store_true',
+                        help='Keep the OpenAI request/token quotas from config_rewriter.py')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved earlier with --output')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline before a stage counts as regressed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with open(REPO_CONFIG, 'r') as f:
+        config = json.load(f)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        site_root = os.path.join(workdir, 'site')
+        if args.pages:
+            paths = build_replay_site(site_root, args.pages, config['websites'], rng)
+        else:
+            paths = build_synthetic_site(site_root, config['websites'], args.articles, rng)
+
+        stubs = []
+        try:
+            process, site_url = start_stub('stubs.site_server', '--root', site_root,
+                                           '--latency', str(args.site_latency))
+            stubs.append(process)
+            process, openai_url = start_stub('stubs.openai_server', '--latency', str(args.openai_latency),
+                                             '--error-rate', str(args.openai_429_rate))
+            stubs.append(process)
+            process, wordpress_url = start_stub('stubs.wordpress_server',
+                                                '--latency', str(args.wordpress_latency),
+                                                *(['--no-batch'] if args.wordpress_no_batch else []))
+            stubs.append(process)
+
+            # The stage modules read these when they are first imported
+            os.environ.update({
+                'DATABASE_PATH': os.path.join(workdir, 'articles.db'),
+                'OPENAI_BASE_URL': openai_url,
+                'OPENAI_API_KEY': 'bench',
+                'WORDPRESS_URL': wordpress_url,
+                'WORDPRESS_USERNAME': 'bench',
+                'WORDPRESS_PASSWORD': 'bench',
+            })
+            os.chdir(workdir)
+            import config_rewriter
+            config_rewriter.CACHE_FILE = os.path.join(workdir, 'openai_cache.db')
+            if not args.real_limits:
+                config_rewriter.REQUESTS_PER_MINUTE = 10 ** 6
+                config_rewriter.TOKENS_PER_MINUTE = 10 ** 9
+            import blog_rewriter  # noqa: F401
+            import blog_poster  # noqa: F401
+            logging.disable(logging.INFO)
+
+            config = dict(config, websites=[dict(website, url=site_url + paths[website['name']])
+                                            for website in config['websites'] if website['name'] in paths])
+
+            results = {}
+            posts, results['scrape'] = measure(lambda: scrape_stage(config))
+            posts, results['dedup'] = measure(lambda: dedup_stage(posts, os.path.join(workdir, 'articles.db')))
+            posts, results['rewrite'] = measure(lambda: rewrite_stage(posts))
+            if args.publish_mode == 'batch':
+                _, results['publish'] = measure(
+                    lambda: bulk_publish_stage(posts, wordpress_url, not args.wordpress_no_batch))
+            else:
+                _, results['publish'] = measure(lambda: publish_stage(posts, site_url, bool(args.pages)))
+        finally:
+            os.chdir(REPO_DIR)
+            for process in stubs:
+                process.terminate()
+                process.wait()
+
+    print(f"{'stage':<8} {'items':>6} {'seconds':>8} {'items/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'peak RSS MB':>12} {'errors':>7}")
+    for stage in STAGES:
+        stats = results[stage]
+        print(f"{stage:<8} {stats['items']:>6} {stats['seconds']:>8.2f} {stats['throughput']:>8.2f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['peak_rss_mb']:>12.1f} {stats['errors']:>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'stages': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['stages']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,61 +1,194 @@
-import json
+import os
 import time
 import logging
+import log_utils
+import metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from apscheduler.schedulers.background import BackgroundScheduler
-from wordpress_api import post_to_wordpress, upload_featured_image
+from article_store import ArticleStore
+from wordpress_api import PublishError, post_to_wordpress, post_batch_to_wordpress, upload_featured_image
 from config import Config
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 CHECK_INTERVAL = 300  # 5 minutes
+LEGACY_INDEX_FILE = 'last_posted_index.txt'
 
-def get_last_posted_index():
-    try:
-        with open('last_posted_index.txt', 'r') as file:
-            return int(file.read().strip())
-    except FileNotFoundError:
-        return -1
+def attach_featured_image(post_id, post):
+    # A retry keeps the image uploaded by the previous attempt
+    if 'featured_media' not in post and post.get('image'):
+        with metrics.span('upload_image', metrics.trace_id_for(post.get('link')), image=post['image']):
+            featured_image_id = upload_featured_image(post['image'])
+        if featured_image_id:
+            post['featured_media'] = featured_image_id
+        else:
+            logger.warning(f"Failed to upload featured image for post {post_id}")
+
+def publish_post(post_id, post):
+    """Upload the featured image and create the post. Returns the WordPress post id.
+
+    Raises PublishError when the post was not created.
+    """
+    logger.info("Processing post %s: %s", post_id, post['title'])
+    with metrics.span('publish', metrics.trace_id_for(post.get('link')), post_id=post_id) as attributes:
+        attach_featured_image(post_id, post)
+        attributes['wp_post_id'] = post_to_wordpress(post)
+    return attributes['wp_post_id']
+
+def publish_with_retries(post_id, post, max_attempts=Config.PUBLISH_MAX_ATTEMPTS):
+    """Publish a post, retrying requests that never reached WordPress and 429. Raises the last PublishError."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return publish_post(post_id, post)
+        except PublishError as e:
+            if not e.retryable or attempt == max_attempts:
+                raise
+            delay = Config.PUBLISH_RETRY_DELAY * 2 ** (attempt - 1)
+            logger.warning(f"Post {post_id} failed (attempt {attempt}/{max_attempts}), retrying in {delay}s")
+            time.sleep(delay)
+
+def record_failure(store, post_id, error):
+    """Put a failed post in the ledger.
+
+    A post that may exist in WordPress anyway is marked uncertain, one that
+    failed permanently or too often is marked dead.
+    """
+    if isinstance(error, PublishError) and error.uncertain:
+        store.mark_uncertain(post_id)
+        logger.error(f"Post {post_id} may have been published ({error}); check WordPress, "
+                     f"then run 'python article_store.py requeue'")
+        return
+    permanent = isinstance(error, PublishError) and not error.retryable
+    if store.mark_failed(post_id, permanent=permanent):
+        logger.error(f"Giving up on post {post_id}: {error}")
+    else:
+        logger.error(f"Failed to post article {post_id}, will retry it later: {error}")
+
+def unique_posts(pending):
+    """Drop repeated post ids, keeping the first occurrence of each."""
+    posts = {}
+    for post_id, post in pending:
+        posts.setdefault(post_id, post)
+    return list(posts.items())
+
+def publish_claimed(store, post_id, post, claimed=False):
+    """Claim a post in the ledger, then publish it. Returns None if it is not up for posting."""
+    if not claimed and not store.claim_post(post_id):
+        logger.debug("Post %s is already published or being published", post_id)
+        return None
+    return publish_with_retries(post_id, post)
+
+def publish_posts(pending, store, concurrency=Config.PUBLISH_CONCURRENCY, claimed=False):
+    """Publish (post_id, post) pairs with up to `concurrency` posts in flight.
 
-def update_last_posted_index(index):
-    with open('last_posted_index.txt', 'w') as file:
-        file.write(str(index))
+    Each worker claims its post in the posting ledger, uploads its image
+    and creates the post, so images for the next posts upload while
+    earlier posts are being created. Every result goes straight into the
+    ledger; a failed post stays there and is retried on the next check
+    until it is marked dead. Pass `claimed=True` for posts already claimed.
+    """
+    published = failed = 0
+    pending = unique_posts(pending)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='publish') as executor:
+        futures = {executor.submit(publish_claimed, store, post_id, post, claimed): post_id
+                   for post_id, post in pending}
+        for future in as_completed(futures):
+            post_id = futures[future]
+            try:
+                wp_post_id = future.result()
+            except Exception as e:
+                record_failure(store, post_id, e)
+                failed += 1
+                continue
+            if wp_post_id:
+                store.mark_published(post_id, wp_post_id)
+                published += 1
+    return published, failed
+
+def publish_posts_bulk(pending, store, concurrency=Config.PUBLISH_CONCURRENCY,
+                       batch_size=Config.WORDPRESS_BATCH_SIZE):
+    """Publish (post_id, post) pairs through the WordPress batch endpoint.
+
+    Featured images still go up one request each (the batch endpoint takes
+    no file bodies), `concurrency` at a time. Posts then go out
+    `batch_size` per request. Posts that fail inside a batch with a 429
+    get the single-post path with its retries, and so does everything
+    when the site has no batch endpoint. When a whole batch fails, its
+    posts are recorded as failed, or as uncertain if WordPress may have
+    created them, and the rest wait for the next check.
+    """
+    pending = unique_posts(pending)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='publish') as executor:
+        list(executor.map(lambda item: attach_featured_image(*item), pending))
+
+    published = failed = 0
+    retry = []
+    unsent = []
+    for start in range(0, len(pending), batch_size):
+        chunk = [(post_id, post) for post_id, post in pending[start:start + batch_size]
+                 if store.claim_post(post_id)]
+        if not chunk:
+            continue
+        try:
+            results = post_batch_to_wordpress([post for _, post in chunk])
+        except PublishError as e:
+            for post_id, _ in chunk:
+                record_failure(store, post_id, e)
+            failed += len(chunk)
+            break
+        if results is None:
+            retry.extend(chunk)
+            unsent = pending[start + batch_size:]
+            break
+        for (post_id, post), result in zip(chunk, results):
+            if not isinstance(result, PublishError):
+                store.mark_published(post_id, result)
+                published += 1
+            elif result.retryable:
+                retry.append((post_id, post))
+            else:
+                record_failure(store, post_id, result)
+                failed += 1
+
+    retried, retry_failed = publish_posts(retry, store, concurrency, claimed=True)
+    sent, unsent_failed = publish_posts(unsent, store, concurrency)
+    return published + retried + sent, failed + retry_failed + unsent_failed
 
 def check_for_updates():
     try:
         logger.info("Checking for updates...")
-        with open(Config.JSON_FILE_PATH, 'r') as file:
-            data = json.load(file)
-        
-        last_posted_index = get_last_posted_index()
-        
-        for index, post in enumerate(data[last_posted_index + 1:], start=last_posted_index + 1):
-            logger.info(f"Processing post {index}: {post['title']}")
-            
-            featured_image_id = upload_featured_image(post['image'])
-            if featured_image_id:
-                post['featured_media'] = featured_image_id
-            else:
-                logger.warning(f"Failed to upload featured image for post {index}")
-            
-            if post_to_wordpress(post):
-                update_last_posted_index(index)
-                logger.info(f"Successfully posted and updated index to {index}")
+        store = ArticleStore()
+        try:
+            pending = store.unpublished_posts()
+            if Config.PUBLISH_MODE == 'batch':
+                published, failed = publish_posts_bulk(pending, store)
             else:
-                logger.error(f"Failed to post article {index}")
-                break
-        logger.info("Update check completed.")
+                published, failed = publish_posts(pending, store)
+        finally:
+            store.close()
+        logger.info(f"Update check completed: {published} posted, {failed} failed.")
     except Exception as e:
         logger.exception(f"Error checking for updates: {e}")
 
 def main():
+    log_utils.setup_logging()
     logger.info("Starting blog posting script")
     
     if not all([Config.WORDPRESS_URL, Config.WORDPRESS_USERNAME, Config.WORDPRESS_PASSWORD]):
         logger.error("WordPress configuration is incomplete. Please set WORDPRESS_URL, WORDPRESS_USERNAME, and WORDPRESS_PASSWORD environment variables.")
         return
 
+    if os.path.exists(LEGACY_INDEX_FILE):
+        logger.warning(f"{LEGACY_INDEX_FILE} is no longer used; run "
+                       f"'python article_store.py migrate-ledger' once, then delete it")
+    store = ArticleStore()
+    try:
+        store.recover_interrupted()
+    finally:
+        store.close()
+
+    metrics.start_server()
+
     # Manually trigger an update check when the script starts
     check_for_updates()
 
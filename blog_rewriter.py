@@ -1,68 +1,210 @@
 import json
 import logging
-import time
-from chat_request import send_openai_request
-from config_rewriter import MAX_TOKENS, RATE_LIMIT_DELAY
+import log_utils
+from concurrent.futures import ThreadPoolExecutor
+from chat_request import send_openai_request, count_tokens, MODEL, RESPONSE_FORMAT
+from config_rewriter import (
+    MAX_TOKENS, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE,
+    MAX_CONCURRENT_POSTS, MAX_CONCURRENT_REQUESTS,
+    CACHE_FILE, CACHE_MAX_ENTRIES, CACHE_TTL, COMBINED_TITLE_REWRITE
+)
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
+# Shared by every post so the whole process stays inside the OpenAI quota
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+# Successful responses are reused, so a retried post only pays for new chunks
+response_cache = ResponseCache(CACHE_FILE, CACHE_MAX_ENTRIES, CACHE_TTL)
+# Chunk and title requests of all posts run here; post workers only wait on
+# these futures and never submit to their own pool, so they cannot deadlock
+request_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS,
+                                      thread_name_prefix='openai-request')
 
 def chunk_content(content, max_tokens):
-    words = content.split()
+    """Pack whole paragraphs into chunks of at most `max_tokens` tokens.
+
+    Paragraphs are the lines kept by the scraper; a paragraph that is too
+    long on its own is split on word boundaries.
+    """
     chunks = []
     current_chunk = []
     current_token_count = 0
-
-    for word in words:
-        word_token_count = len(word.encode('utf-8')) // 4  # Better estimate for UTF-8 encoded text
-        if current_token_count + word_token_count > max_tokens:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_token_count = word_token_count
-        else:
-            current_chunk.append(word)
-            current_token_count += word_token_count
+    separator_tokens = count_tokens('\n')
+
+    for paragraph, paragraph_tokens in iter_paragraphs(content, max_tokens):
+        needed = paragraph_tokens + (separator_tokens if current_chunk else 0)
+        if current_chunk and current_token_count + needed > max_tokens:
+            chunks.append('\n'.join(current_chunk))
+            current_chunk = []
+            current_token_count = 0
+            needed = paragraph_tokens
+        current_chunk.append(paragraph)
+        current_token_count += needed
 
     if current_chunk:
-        chunks.append(" ".join(current_chunk))
+        chunks.append('\n'.join(current_chunk))
 
     return chunks
 
-def rewrite_blog_posts(blogs):
+def iter_paragraphs(content, max_tokens):
+    """Yield (paragraph, token count) pairs, each paragraph at most `max_tokens` tokens."""
+    for paragraph in content.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        paragraph_tokens = count_tokens(paragraph)
+        if paragraph_tokens <= max_tokens:
+            yield paragraph, paragraph_tokens
+            continue
+
+        words = []
+        token_count = 0
+        for word in paragraph.split():
+            word_tokens = count_tokens(' ' + word)
+            if words and token_count + word_tokens > max_tokens:
+                piece = ' '.join(words)
+                yield piece, count_tokens(piece)
+                words = []
+                token_count = 0
+            words.append(word)
+            token_count += word_tokens
+        if words:
+            piece = ' '.join(words)
+            yield piece, count_tokens(piece)
+
+def rewrite_blog_posts(blogs, on_rewritten=None):
+    """Rewrite posts concurrently.
+
+    `on_rewritten(i, rewritten_blog)` is called from the worker as soon as
+    post i is done, so callers can persist each post without waiting for
+    the whole batch; a post whose callback fails counts as not processed.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_POSTS,
+                            thread_name_prefix='rewrite-post') as executor:
+        results = list(executor.map(
+            lambda item: rewrite_single_blog(item[0], item[1], len(blogs), on_rewritten),
+            enumerate(blogs)))
+
     rewritten_blogs = []
     processed_indices = []
-
-    for i, blog in enumerate(blogs):
-        logging.info(f"Processing blog post {i+1} of {len(blogs)}")
-
-        try:
-            if 'full_text' not in blog or not blog['full_text']:
-                raise ValueError(f"Blog post {i+1} has no content")
-            
-            rewritten_content = rewrite_blog_post(blog['title'], blog['full_text'])
-            rewritten_blog = {
-                'title': rewritten_content['title'],
-                'full_text': rewritten_content['content'],
-                'image': blog.get('image', ''),
-                'link': blog.get('link', ''),
-                'categories': blog.get('categories', '')
-            }
+    for i, rewritten_blog in enumerate(results):
+        if rewritten_blog is not None:
             rewritten_blogs.append(rewritten_blog)
             processed_indices.append(i)
-            logging.info(f"Successfully rewrote blog post {i+1}")
-        except ValueError as ve:
-            logging.error(f"Error rewriting blog post {i+1}: {str(ve)}")
-        except Exception as e:
-            logging.error(f"Unexpected error rewriting blog post {i+1}: {str(e)}")
 
-        time.sleep(RATE_LIMIT_DELAY)  # Rate limiting
+    stats = response_cache.stats()
+    logging.info(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
 
     return rewritten_blogs, processed_indices
 
+def rewrite_single_blog(i, blog, total, on_rewritten=None):
+    log_utils.log_sampled(logging.root, logging.INFO, 'rewriter.processing',
+                          "Processing blog post %d of %d", i + 1, total)
+
+    try:
+        if 'full_text' not in blog or not blog['full_text']:
+            raise ValueError(f"Blog post {i+1} has no content")
+
+        rewritten_content = rewrite_blog_post(blog['title'], blog['full_text'])
+        rewritten_blog = make_rewritten_blog(blog, rewritten_content)
+        if on_rewritten:
+            on_rewritten(i, rewritten_blog)
+        log_utils.log_sampled(logging.root, logging.INFO, 'rewriter.rewritten',
+                              "Successfully rewrote blog post %d", i + 1)
+        return rewritten_blog
+    except ValueError as ve:
+        logging.error(f"Error rewriting blog post {i+1}: {str(ve)}")
+    except Exception as e:
+        logging.error(f"Unexpected error rewriting blog post {i+1}: {str(e)}")
+    return None
+
+def make_rewritten_blog(blog, rewritten_content):
+    return {
+        'title': rewritten_content['title'],
+        'full_text': rewritten_content['content'],
+        'image': blog.get('image', ''),
+        'link': blog.get('link', ''),
+        'categories': blog.get('categories', '')
+    }
+
 def rewrite_blog_post(title, content):
+    requests = plan_rewrite_requests(title, content)
+
+    # All chunks and the title go out at once; results are collected in order
+    futures = [request_executor.submit(run_rewrite_request, *request)
+               for request in requests]
+    try:
+        results = [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
+    return assemble_rewrite(requests, results)
+
+def plan_rewrite_requests(title, content):
+    """List the (prompt, required_keys, label) requests that rewrite one post."""
     chunks = chunk_content(content, MAX_TOKENS)
-    rewritten_chunks = []
+    # The first chunk request can return the title too, saving a request
+    combined = COMBINED_TITLE_REWRITE and bool(chunks)
+
+    requests = [build_chunk_prompt(title, chunk, i, combined and i == 0)
+                for i, chunk in enumerate(chunks)]
+    if not combined:
+        requests.append(build_title_prompt(title))
+    return requests
+
+def assemble_rewrite(requests, results):
+    """Join parsed responses, in request order, into the rewritten title and content."""
+    contents = []
+    rewritten_title = None
+    for (_, required_keys, _), result in zip(requests, results):
+        if 'content' in required_keys:
+            contents.append(result['content'])
+        if 'title' in required_keys:
+            rewritten_title = result['title']
+
+    return {
+        'title': rewritten_title,
+        'content': '\n'.join(contents)
+    }
 
-    for i, chunk in enumerate(chunks):
+def cached_openai_request(prompt):
+    # Returns (response, cache_key); cache_key is None for a cache hit.
+    # Callers store a fresh response only once it has been validated, so a
+    # malformed reply is never served from the cache
+    cache_key = ResponseCache.make_key(MODEL, prompt, RESPONSE_FORMAT)
+    response = response_cache.get(cache_key)
+    if response is not None:
+        return response, None
+    return send_openai_request(prompt, rate_limiter), cache_key
+
+def run_rewrite_request(prompt, required_keys, label):
+    try:
+        response, cache_key = cached_openai_request(prompt)
+        result = parse_response(response, required_keys, label)
+        if cache_key:
+            response_cache.set(cache_key, response)
+        return result
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"Error in ChatGPT API call for {label}: {str(e)}")
+
+def parse_response(response, required_keys, label):
+    try:
+        parsed = json.loads(response)
+    except json.JSONDecodeError:
+        raise ValueError(f"Failed to parse ChatGPT response as JSON for {label}")
+    for key in required_keys:
+        if key not in parsed:
+            raise ValueError(f"ChatGPT response for {label} does not contain '{key}' key")
+    return parsed
+
+def build_chunk_prompt(title, chunk, i, include_title=False):
+    if include_title:
         prompt = f'''
-Aşağıdaki blog yazısını yeniden yaz. İçerisindeki yazım hatalarından ve anlaşılmaz karakterlerden de kurtul. Orjinal bilgileri koru ancak farklı kelimeler ve yapı kullan. Sonucu 'content' anahtarı ile bir JSON nesnesi olarak döndürün. Türkçe karakterleri koruyun.
+Aşağıdaki blog yazısını ve başlığını yeniden yaz. İçerisindeki yazım hatalarından ve anlaşılmaz karakterlerden de kurtul. Orjinal bilgileri koru ancak farklı kelimeler ve yapı kullan. Başlıkta genel mesajı koru ancak ilgi çekici olsun. Sonucu 'title' ve 'content' anahtarları ile bir JSON nesnesi olarak döndürün. Türkçe karakterleri koruyun.
 
 Orijinal Başlık: {title}
 
@@ -71,21 +213,21 @@ Orijinal İçerik Parçası:
 
 Yeniden yazılmış versiyon:
 '''
+        return prompt, ('title', 'content'), f"chunk {i+1}"
+
+    prompt = f'''
+Aşağıdaki blog yazısını yeniden yaz. İçerisindeki yazım hatalarından ve anlaşılmaz karakterlerden de kurtul. Orjinal bilgileri koru ancak farklı kelimeler ve yapı kullan. Sonucu 'content' anahtarı ile bir JSON nesnesi olarak döndürün. Türkçe karakterleri koruyun.
+
+Orijinal Başlık: {title}
 
-        try:
-            response = send_openai_request(prompt)
-            rewritten_chunk = json.loads(response)
-            if 'content' not in rewritten_chunk:
-                raise ValueError(f"ChatGPT response for chunk {i+1} does not contain 'content' key")
-            rewritten_chunks.append(rewritten_chunk['content'])
-        except json.JSONDecodeError:
-            raise ValueError(f"Failed to parse ChatGPT response as JSON for chunk {i+1}")
-        except Exception as e:
-            raise Exception(f"Error in ChatGPT API call for chunk {i+1}: {str(e)}")
+Orijinal İçerik Parçası:
+{chunk}
 
-        time.sleep(RATE_LIMIT_DELAY)  # Rate limiting
+Yeniden yazılmış versiyon:
+'''
+    return prompt, ('content',), f"chunk {i+1}"
 
-    # Rewrite the title
+def build_title_prompt(title):
     title_prompt = f'''
 Aşağıdaki blog yazısı başlığını yeniden yaz. Genel mesajı koruyu ancak ilgi çekici olsun. Sonucu 'title' anahtarı ile bir JSON nesnesi olarak döndürün. Türkçe karakterleri koruyun.
 
@@ -93,19 +235,4 @@ Orijinal Başlık: {title}
 
 Yeniden yazılmış versiyon:
 '''
-
-    try:
-        title_response = send_openai_request(title_prompt)
-        rewritten_title_json = json.loads(title_response)
-        if 'title' not in rewritten_title_json:
-            raise ValueError("ChatGPT response for title does not contain 'title' key")
-        rewritten_title = rewritten_title_json['title']
-    except json.JSONDecodeError:
-        raise ValueError("Failed to parse ChatGPT response as JSON for title")
-    except Exception as e:
-        raise Exception(f"Error in ChatGPT API call for title: {str(e)}")
-
-    return {
-        'title': rewritten_title,
-        'content': ' '.join(rewritten_chunks)
-    }
+    return title_prompt, ('title',), "title"
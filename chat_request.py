@@ -1,23 +1,160 @@
+import logging
 import os
-from openai import OpenAI
+import threading
+import time
+import httpx
+from openai import APIConnectionError, APIStatusError, OpenAI, RateLimitError
+import metrics
+from config_rewriter import (
+    RATE_LIMIT_RETRIES, RATE_LIMIT_BACKOFF, OPENAI_TIMEOUT, OPENAI_CONNECT_TIMEOUT,
+    OPENAI_MAX_RETRIES, OPENAI_MAX_CONNECTIONS
+)
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+MODEL = "gpt-4o-mini"
+RESPONSE_FORMAT = {"type": "json_object"}
 
-def send_openai_request(prompt: str) -> str:
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+REQUEST_SECONDS = metrics.histogram(
+    'openai_request_seconds', 'OpenAI chat completion latency by outcome', ['outcome'])
+TOKENS_PER_CALL = metrics.histogram(
+    'openai_tokens_per_call', 'Tokens used by one chat completion', ['kind'], TOKEN_BUCKETS)
+
+_client = None
+_client_lock = threading.Lock()
+_encoding = _NOT_LOADED = object()
+_encoding_lock = threading.Lock()
+
+
+def _client_options():
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+    timeout = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    limits = httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                          max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+    return timeout, limits
+
+
+def get_client() -> OpenAI:
+    """Return the process-wide OpenAI client, keeping its connections alive."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                timeout, limits = _client_options()
+                _client = OpenAI(
+                    api_key=OPENAI_API_KEY,
+                    timeout=timeout,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=httpx.Client(timeout=timeout, limits=limits),
+                )
+    return _client
+
 
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+def get_encoding():
+    """Return the tiktoken encoding for MODEL, or None if tiktoken is missing."""
+    global _encoding
+    if _encoding is _NOT_LOADED:
+        with _encoding_lock:
+            if _encoding is _NOT_LOADED:
+                _encoding = _load_encoding()
+    return _encoding
 
+
+def _load_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("OpenAI returned an empty response.")
-        return content
+        try:
+            return tiktoken.encoding_for_model(MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
     except Exception as e:
-        raise Exception(f"OpenAI API error: {str(e)}")
+        # The BPE file is downloaded on first use and may be unreachable
+        logging.warning(f"Could not load tiktoken encoding, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        # Rough UTF-8 estimate; never 0 so short words still take up room
+        return max(1, len(text.encode('utf-8')) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_retry_after(error: RateLimitError):
+    headers = getattr(error.response, 'headers', None) or {}
+    for header, scale in (('retry-after-ms', 0.001), ('retry-after', 1)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def _request_options(prompt: str) -> dict:
+    return {
+        "model": MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": RESPONSE_FORMAT,
+    }
+
+
+def _record_usage(response):
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    TOKENS_PER_CALL.observe(usage.prompt_tokens or 0, kind='prompt')
+    TOKENS_PER_CALL.observe(usage.completion_tokens or 0, kind='completion')
+
+
+def _response_content(response) -> str:
+    _record_usage(response)
+    content = response.choices[0].message.content
+    if not content:
+        raise ValueError("OpenAI returned an empty response.")
+    return content
+
+
+def _is_transient(error) -> bool:
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in (408, 409) or error.status_code >= 500)
+
+
+def send_openai_request(prompt: str, rate_limiter=None, client: OpenAI = None) -> str:
+    # Retries happen here only: an SDK retry of a 429 would skip the shared pause
+    openai_client = (client or get_client()).with_options(max_retries=0)
+    # The reply is roughly as long as the prompt, so budget for both
+    estimated_tokens = 2 * count_tokens(prompt)
+    rate_limited = failed = 0
+
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire(estimated_tokens)
+        start = time.perf_counter()
+        try:
+            response = openai_client.chat.completions.create(**_request_options(prompt))
+        except RateLimitError as e:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, outcome='rate_limited')
+            if rate_limited == RATE_LIMIT_RETRIES:
+                raise Exception(f"OpenAI API error: {str(e)}")
+            delay = get_retry_after(e) or RATE_LIMIT_BACKOFF * 2 ** rate_limited
+            rate_limited += 1
+            if rate_limiter:
+                rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            continue
+        except Exception as e:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, outcome='error')
+            if not _is_transient(e) or failed == OPENAI_MAX_RETRIES:
+                raise Exception(f"OpenAI API error: {str(e)}")
+            time.sleep(RATE_LIMIT_BACKOFF * 2 ** failed)
+            failed += 1
+            continue
+        REQUEST_SECONDS.observe(time.perf_counter() - start, outcome='ok')
+        return _response_content(response)
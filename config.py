@@ -1,8 +1,65 @@
 import os
 
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
 class Config:
-    JSON_FILE_PATH = 'rewritten_blogs.json'
+    DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(BASE_DIR, 'articles.db'))
     WORDPRESS_URL = os.environ.get('WORDPRESS_URL')
     WORDPRESS_USERNAME = os.environ.get('WORDPRESS_USERNAME')
     WORDPRESS_PASSWORD = os.environ.get('WORDPRESS_PASSWORD')
+
+    # Shared HTTP client settings (see http_client.py)
+    HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+    HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 30))
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+    HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+
+    # Pipeline settings (see pipeline.py)
+    SCRAPE_INTERVAL = int(os.environ.get('SCRAPE_INTERVAL', 3600))
+    PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 100))
+    PIPELINE_REWRITE_WORKERS = int(os.environ.get('PIPELINE_REWRITE_WORKERS', 4))
+    PIPELINE_PUBLISH_WORKERS = int(os.environ.get('PIPELINE_PUBLISH_WORKERS', 2))
+    PIPELINE_MAX_ATTEMPTS = int(os.environ.get('PIPELINE_MAX_ATTEMPTS', 3))
+    PIPELINE_RETRY_DELAY = int(os.environ.get('PIPELINE_RETRY_DELAY', 60))
+
+    # Near-duplicate detection before rewriting (see dedup.py)
+    DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', 0.7))
+    DEDUP_NUM_PERM = int(os.environ.get('DEDUP_NUM_PERM', 128))
+    DEDUP_BANDS = int(os.environ.get('DEDUP_BANDS', 32))
+    DEDUP_SHINGLE_SIZE = int(os.environ.get('DEDUP_SHINGLE_SIZE', 3))
+
+    # WordPress publishing settings (see blog_poster.py)
+    PUBLISH_CONCURRENCY = int(os.environ.get('PUBLISH_CONCURRENCY', 4))
+    PUBLISH_MAX_ATTEMPTS = int(os.environ.get('PUBLISH_MAX_ATTEMPTS', 3))
+    PUBLISH_RETRY_DELAY = float(os.environ.get('PUBLISH_RETRY_DELAY', 5))
+    # Failed checks after which a post is marked dead and no longer retried
+    PUBLISH_MAX_FAILURES = int(os.environ.get('PUBLISH_MAX_FAILURES', 5))
+    # 'single' posts one request per article, 'batch' groups them through /wp-json/batch/v1
+    PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'single')
+    # WordPress rejects batches above 25 requests unless raised with a filter
+    WORDPRESS_BATCH_SIZE = int(os.environ.get('WORDPRESS_BATCH_SIZE', 25))
+
+    # Featured image optimization (see image_optimizer.py)
+    IMAGE_OPTIMIZE = os.environ.get('IMAGE_OPTIMIZE', 'false').lower() in ('1', 'true', 'yes')
+    IMAGE_MAX_WIDTH = int(os.environ.get('IMAGE_MAX_WIDTH', 1200))
+    IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'webp').lower()
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+
+    # Metrics endpoint and tracing (see metrics.py)
+    # 0 disables the /metrics endpoint; daemons run as separate processes need one port each
+    METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+    METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+    # JSON lines file for spans following each post from scrape to publish; empty disables tracing
+    TRACE_FILE = os.environ.get('TRACE_FILE', '')
+
+    # Logging (see log_utils.py)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # 'text' or 'json' (one object per line)
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+    # Per-article INFO messages are logged once per this many articles
+    LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', 10))
@@ -1,32 +1,42 @@
 import os
-import json
+from config import Config
 
 # File paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-INPUT_FILE = os.path.join(BASE_DIR, 'scraped_data.json')
-OUTPUT_FILE = os.path.join(BASE_DIR, 'rewritten_blogs.json')
+DATABASE_FILE = Config.DATABASE_PATH
 
 # API settings
 MAX_TOKENS = 2000  # Maximum number of tokens for each API request
-RATE_LIMIT_DELAY = 10  # Delay between API calls in seconds
+REQUESTS_PER_MINUTE = 60  # OpenAI request quota shared by all rewrite workers
+TOKENS_PER_MINUTE = 200000  # OpenAI token quota shared by all rewrite workers
+RATE_LIMIT_RETRIES = 5  # Attempts after a 429 before giving up on a request
+RATE_LIMIT_BACKOFF = 2  # Base backoff in seconds when no Retry-After is sent
+OPENAI_TIMEOUT = 120  # Seconds to wait for a chat completion
+OPENAI_CONNECT_TIMEOUT = 10  # Seconds to wait for a connection to OpenAI
+OPENAI_MAX_RETRIES = 2  # Retries on connection errors and 5xx; a 429 counts against RATE_LIMIT_RETRIES instead
+OPENAI_MAX_CONNECTIONS = 16  # Keep-alive connections shared by all requests
+COMBINED_TITLE_REWRITE = True  # Rewrite the title together with the first chunk
 
-# Rewriter settings
-CHECK_INTERVAL = 600  # Time to wait before checking for new content (in seconds)
+# Batch API settings (used with --backend batch)
+REWRITE_BACKEND = 'sync'  # 'sync' for chat completions, 'batch' for the Batch API
+BATCH_DIR = os.path.join(BASE_DIR, 'batches')  # Where batch input files are written
+BATCH_POLL_INTERVAL = 60  # Seconds between batch status checks
+BATCH_COMPLETION_WINDOW = '24h'
+BATCH_TIMEOUT = 25 * 3600  # Seconds after submission before an unfinished batch is cancelled
+BATCH_MAX_REQUESTS = 50000  # Per-batch request limit of the Batch API
+BATCH_MAX_BYTES = 190 * 1024 * 1024  # Input file size per batch, under the API's 200 MB limit
+
+# Response cache settings
+CACHE_FILE = os.path.join(BASE_DIR, 'openai_cache.db')
+CACHE_MAX_ENTRIES = 10000  # Least recently used responses are evicted beyond this
+CACHE_TTL = 30 * 24 * 3600  # Cached responses expire after 30 days
 
-def check_file_exists(file_path):
-    """Check if a file exists and is readable."""
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-    if not os.access(file_path, os.R_OK):
-        raise PermissionError(f"Permission denied: {file_path}")
+# Concurrency settings
+MAX_CONCURRENT_POSTS = 4  # Blog posts rewritten at the same time
+MAX_CONCURRENT_REQUESTS = 8  # OpenAI requests in flight across all posts
 
-def validate_json_file(file_path):
-    """Validate that a file contains valid JSON."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            json.load(f)
-    except json.JSONDecodeError:
-        raise ValueError(f"Invalid JSON in file: {file_path}")
+# Rewriter settings
+CHECK_INTERVAL = 600  # Time to wait before checking for new content (in seconds)
 
 def ensure_directory_exists(file_path):
     """Ensure that the directory for a file exists, creating it if necessary."""
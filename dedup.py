@@ -0,0 +1,237 @@
+"""Near-duplicate detection for scraped articles, run before any rewrite tokens are spent.
+
+Each article's text is cut into word shingles and summarised by a MinHash
+signature. Signatures are split into bands and every band is hashed into a
+bucket (LSH), so finding candidates is a handful of indexed lookups no
+matter how large the archive grows. Candidates are then confirmed by the
+estimated Jaccard similarity of their signatures.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+import log_utils
+import metrics
+from article_store import ArticleStore, STATUS_DUPLICATE, STATUS_REWRITTEN
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS minhash_signatures (
+    article_id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS minhash_bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    article_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_minhash_bands_bucket ON minhash_bands (band, bucket);
+CREATE TABLE IF NOT EXISTS duplicates (
+    article_id INTEGER PRIMARY KEY,
+    duplicate_of INTEGER NOT NULL,
+    similarity REAL NOT NULL,
+    found_at REAL NOT NULL
+);
+"""
+
+MERSENNE_PRIME = (1 << 61) - 1
+WORD_RE = re.compile(r'\w+')
+
+
+def shingles(text, size):
+    words = WORD_RE.findall(text.casefold())
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def article_text(article):
+    return f"{article.get('title', '')}\n{article.get('full_text', '')}"
+
+
+class DuplicateIndex:
+    """MinHash/LSH index of scraped articles, stored next to them in the article database.
+
+    With `bands` bands of `num_perm / bands` rows, two articles become
+    candidates with high probability once their similarity passes about
+    (1 / bands) ** (bands / num_perm); `threshold` then decides.
+
+    An empty index is first seeded from the archive: scraped articles that
+    were already rewritten, and rewritten posts with no scraped source
+    (imported from rewritten_blogs.json), the latter under -(post id).
+    """
+
+    def __init__(self, path=None, threshold=Config.DEDUP_THRESHOLD, num_perm=Config.DEDUP_NUM_PERM,
+                 bands=Config.DEDUP_BANDS, shingle_size=Config.DEDUP_SHINGLE_SIZE):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.path = path or Config.DATABASE_PATH
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Fixed seed: signatures stored by earlier runs must stay comparable
+        rng = random.Random(1)
+        self.permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+            empty = self.conn.execute('SELECT 1 FROM minhash_signatures LIMIT 1').fetchone() is None
+        if empty:
+            self.seed()
+
+    def seed(self):
+        """Index every article of the archive not indexed yet. Returns how many were added."""
+        with self._lock:
+            tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            rows = []
+            if 'scraped_articles' in tables:
+                rows += self.conn.execute(
+                    'SELECT id, data FROM scraped_articles WHERE status = ?', (STATUS_REWRITTEN,)).fetchall()
+            if 'rewritten_articles' in tables:
+                rows += self.conn.execute(
+                    'SELECT -id, data FROM rewritten_articles WHERE scraped_id IS NULL').fetchall()
+        signatures = [(article_id, self.signature(article_text(json.loads(data)))) for article_id, data in rows]
+        with self._lock, self.conn:
+            added = sum(self._insert(article_id, signature)
+                        for article_id, signature in signatures if signature is not None)
+        if added:
+            logger.info(f"Seeded the duplicate index with {added} archived articles")
+        return added
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def signature(self, text):
+        """Return the MinHash signature of `text`, or None if it has no words."""
+        shingle_set = shingles(text, self.shingle_size)
+        if not shingle_set:
+            return None
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+                  for shingle in shingle_set]
+        return array('Q', [min((a * h + b) % MERSENNE_PRIME for h in hashes)
+                           for a, b in self.permutations])
+
+    def buckets(self, signature):
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            yield band, int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True)
+
+    def find_duplicate(self, signature):
+        """Return (article_id, similarity) of the closest indexed article above the threshold, or None."""
+        with self._lock:
+            candidates = set()
+            for band, bucket in self.buckets(signature):
+                candidates.update(row[0] for row in self.conn.execute(
+                    'SELECT article_id FROM minhash_bands WHERE band = ? AND bucket = ?', (band, bucket)))
+            best = None
+            for article_id in candidates:
+                row = self.conn.execute(
+                    'SELECT signature FROM minhash_signatures WHERE article_id = ?', (article_id,)).fetchone()
+                other = array('Q')
+                other.frombytes(row[0])
+                similarity = sum(x == y for x, y in zip(signature, other)) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (article_id, similarity)
+        return best
+
+    def add(self, article_id, signature):
+        with self._lock, self.conn:
+            self._insert(article_id, signature)
+
+    def _insert(self, article_id, signature):
+        # Caller holds the lock and the transaction; returns 1 if the article was new
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO minhash_signatures (article_id, signature, indexed_at) VALUES (?, ?, ?)',
+            (article_id, signature.tobytes(), time.time()))
+        if cursor.rowcount:
+            self.conn.executemany(
+                'INSERT INTO minhash_bands (band, bucket, article_id) VALUES (?, ?, ?)',
+                [(band, bucket, article_id) for band, bucket in self.buckets(signature)])
+        return cursor.rowcount
+
+    def record_duplicate(self, article_id, duplicate_of, similarity):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO duplicates (article_id, duplicate_of, similarity, found_at) '
+                'VALUES (?, ?, ?, ?)', (article_id, duplicate_of, similarity, time.time()))
+
+    def is_indexed(self, article_id):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM minhash_signatures WHERE article_id = ?', (article_id,)).fetchone()
+        return row is not None
+
+    def check(self, article_id, article):
+        """Index an article, or return (duplicate_of, similarity) if it is a near-duplicate."""
+        if self.is_indexed(article_id):
+            return None
+        signature = self.signature(article_text(article))
+        if signature is None:
+            return None
+        duplicate = self.find_duplicate(signature)
+        if duplicate:
+            self.record_duplicate(article_id, *duplicate)
+            return duplicate
+        self.add(article_id, signature)
+        return None
+
+
+def drop_duplicates(store, index, articles):
+    """Return the (id, article) pairs that are not near-duplicates of anything seen before.
+
+    Duplicates get the 'duplicate' status in the store, so they are never
+    rewritten or posted.
+    """
+    if not Config.DEDUP_ENABLED:
+        return articles
+    unique, duplicates = [], []
+    for article_id, article in articles:
+        with metrics.span('dedup', metrics.trace_id_for(article.get('link')), article_id=article_id) as attributes:
+            duplicate = index.check(article_id, article)
+            attributes['duplicate_of'] = duplicate[0] if duplicate else None
+        if duplicate:
+            duplicate_of, similarity = duplicate
+            logger.info(f"Skipping {article.get('link')}: {similarity:.0%} similar to article {duplicate_of}")
+            duplicates.append(article_id)
+        else:
+            unique.append((article_id, article))
+    if duplicates:
+        store.set_status(duplicates, STATUS_DUPLICATE)
+    return unique
+
+
+def main():
+    log_utils.setup_logging()
+    parser = argparse.ArgumentParser(description='Find near-duplicate articles among those waiting to be rewritten')
+    parser.add_argument('--database', default=Config.DATABASE_PATH, help='SQLite database file')
+    args = parser.parse_args()
+
+    store = ArticleStore(args.database)
+    index = DuplicateIndex(args.database)
+    try:
+        pending = store.pending_articles()
+        unique = drop_duplicates(store, index, pending)
+        logging.info(f"Checked {len(pending)} pending articles, {len(pending) - len(unique)} near-duplicates")
+    finally:
+        index.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
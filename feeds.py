@@ -0,0 +1,129 @@
+"""Parse RSS 2.0, Atom and XML sitemaps into a common list of entries.
+
+Each entry is a dict with:
+
+    id       GUID (RSS), id (Atom) or loc (sitemap); what seen-tracking keys on
+    link     article URL
+    title    may be None, e.g. in plain sitemaps
+    image    enclosure, media:content/thumbnail or image:loc, or None
+    date     pubDate / published / updated / lastmod as published, or None
+
+A sitemap index yields ('sitemapindex', [{'link', 'date'}, ...]) for the
+child sitemaps instead.
+"""
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
+
+
+class FeedError(ValueError):
+    pass
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def _children(element, name):
+    return [child for child in element if _local(child.tag) == name]
+
+
+def _text(element, *path):
+    """Text of the first descendant reached by local names in `path`, stripped, or None."""
+    for name in path:
+        matches = _children(element, name)
+        if not matches:
+            return None
+        element = matches[0]
+    text = (element.text or '').strip()
+    return text or None
+
+
+def _media_image(element):
+    for child in element.iter():
+        name = _local(child.tag)
+        if name in ('content', 'thumbnail') and child.get('url') and \
+                child.get('medium', 'image') == 'image' and child.get('type', 'image/').startswith('image/'):
+            return child.get('url')
+    return None
+
+
+def _rss_entries(channel, base_url):
+    entries = []
+    for item in _children(channel, 'item'):
+        link = _text(item, 'link')
+        if not link:
+            continue
+        link = urljoin(base_url, link)
+        image = None
+        for enclosure in _children(item, 'enclosure'):
+            if enclosure.get('type', '').startswith('image/') and enclosure.get('url'):
+                image = enclosure.get('url')
+                break
+        entries.append({
+            'id': _text(item, 'guid') or link,
+            'link': link,
+            'title': _text(item, 'title'),
+            'image': image or _media_image(item),
+            'date': _text(item, 'pubDate'),
+        })
+    return entries
+
+
+def _atom_entries(feed, base_url):
+    entries = []
+    for entry in _children(feed, 'entry'):
+        link = None
+        for candidate in _children(entry, 'link'):
+            if candidate.get('rel', 'alternate') == 'alternate' and candidate.get('href'):
+                link = urljoin(base_url, candidate.get('href'))
+                break
+        if not link:
+            continue
+        entries.append({
+            'id': _text(entry, 'id') or link,
+            'link': link,
+            'title': _text(entry, 'title'),
+            'image': _media_image(entry),
+            'date': _text(entry, 'published') or _text(entry, 'updated'),
+        })
+    return entries
+
+
+def _sitemap_entries(urlset, base_url):
+    entries = []
+    for url in _children(urlset, 'url'):
+        link = _text(url, 'loc')
+        if not link:
+            continue
+        link = urljoin(base_url, link)
+        entries.append({
+            'id': link,
+            'link': link,
+            # Google News sitemaps carry the headline and date
+            'title': _text(url, 'news', 'title'),
+            'image': _text(url, 'image', 'loc'),
+            'date': _text(url, 'news', 'publication_date') or _text(url, 'lastmod'),
+        })
+    return entries
+
+
+def parse_feed(markup, base_url=''):
+    """Return (kind, entries) for an RSS, Atom, sitemap or sitemap index document."""
+    try:
+        root = ET.fromstring(markup)
+    except ET.ParseError as e:
+        raise FeedError(f"Not a well-formed feed: {e}") from e
+
+    kind = _local(root.tag)
+    if kind == 'rss':
+        channel = _children(root, 'channel')
+        return 'rss', _rss_entries(channel[0], base_url) if channel else []
+    if kind == 'feed':
+        return 'atom', _atom_entries(root, base_url)
+    if kind == 'urlset':
+        return 'sitemap', _sitemap_entries(root, base_url)
+    if kind == 'sitemapindex':
+        sitemaps = [{'link': urljoin(base_url, _text(sitemap, 'loc')), 'date': _text(sitemap, 'lastmod')}
+                    for sitemap in _children(root, 'sitemap') if _text(sitemap, 'loc')]
+        return 'sitemapindex', sitemaps
+    raise FeedError(f"Unsupported feed type <{kind}>")
@@ -0,0 +1,77 @@
+import logging
+import re
+
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARSER = 'html.parser'
+
+# Selectors of the form `tag`, `tag.cls.cls` or `tag[attr=value]` can be
+# turned into a SoupStrainer; anything more complex is parsed in full.
+_SIMPLE_SELECTOR = re.compile(
+    r"""^(?P<name>[a-zA-Z][\w-]*)?(?P<classes>(?:\.[\w-]+)*)"""
+    r"""(?:\[(?P<attr>[\w-]+)=(?P<quote>["']?)(?P<value>[^"'\]]*)(?P=quote)\])?$""")
+
+
+def resolve_parser(name):
+    """Return a usable BeautifulSoup backend, falling back to html.parser."""
+    name = name or DEFAULT_PARSER
+    if name == 'lxml':
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            logger.warning("lxml is not installed, falling back to html.parser")
+            return DEFAULT_PARSER
+    return name
+
+
+def compile_selectors(website):
+    """Compile every `*_selector` entry of a site config once."""
+    return {
+        key: soupsieve.compile(value)
+        for key, value in website.items()
+        if key.endswith('_selector') and value
+    }
+
+
+def strainer_for(selector):
+    """Build a SoupStrainer that keeps at least every match of `selector`.
+
+    The strainer only looks at the element itself, so it may keep more
+    than the selector would; the compiled selector is still applied
+    afterwards and results are the same as with a full parse.
+    """
+    if not selector:
+        return None
+    match = _SIMPLE_SELECTOR.match(selector.strip())
+    if not match or not (match.group('name') or match.group('classes') or match.group('attr')):
+        return None
+
+    attrs = {}
+    classes = {c for c in match.group('classes').split('.') if c}
+    if classes:
+        # The class attribute is still an unsplit string while straining
+        attrs['class'] = lambda value: bool(value) and classes.issubset(value.split())
+    if match.group('attr'):
+        attrs[match.group('attr')] = match.group('value')
+    return SoupStrainer(match.group('name'), attrs)
+
+
+def tag_strainer(selectors):
+    """Build a SoupStrainer keeping every element named by the tag of any selector.
+
+    Returns None unless each selector is simple and starts with a tag name.
+    """
+    names = []
+    for selector in selectors:
+        match = _SIMPLE_SELECTOR.match(selector.strip()) if selector else None
+        if not match or not match.group('name'):
+            return None
+        names.append(match.group('name'))
+    return SoupStrainer(names)
+
+
+def parse_html(markup, parser=DEFAULT_PARSER, parse_only=None):
+    return BeautifulSoup(markup, parser, parse_only=parse_only)
@@ -0,0 +1,98 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS http_validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS article_cache (
+    url TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    cached_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_article_cache_age ON article_cache (cached_at);
+"""
+
+# Fields of a stored scraped article that an article page would have supplied
+ARTICLE_FIELDS = ('full_text', 'tags', 'title', 'image')
+
+
+class HttpCache:
+    """Store of HTTP validators and parsed article bodies in the article database.
+
+    Validators (ETag / Last-Modified) turn repeat requests into conditional
+    GETs, and article bodies are kept by URL so a known article is never
+    downloaded twice. Articles already in scraped_articles count as cached.
+    Every change is a single-row write, so nothing is rewritten in bulk.
+    """
+
+    def __init__(self, max_articles=5000, path=None):
+        self.path = path or Config.DATABASE_PATH
+        self.max_articles = max_articles
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+            tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self._has_store = 'scraped_articles' in tables
+
+    def close(self):
+        """Drop the oldest article bodies beyond max_articles and close the database."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                'DELETE FROM article_cache WHERE url NOT IN '
+                '(SELECT url FROM article_cache ORDER BY cached_at DESC LIMIT ?)', (self.max_articles,))
+        with self._lock:
+            self.conn.close()
+
+    def conditional_headers(self, url):
+        headers = {}
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT etag, last_modified FROM http_validators WHERE url = ?', (url,)).fetchone()
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def store_validators(self, url, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        with self._lock, self.conn:
+            if etag or last_modified:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO http_validators (url, etag, last_modified) VALUES (?, ?, ?)',
+                    (url, etag, last_modified))
+            else:
+                self.conn.execute('DELETE FROM http_validators WHERE url = ?', (url,))
+
+    def get_article(self, url):
+        with self._lock:
+            row = self.conn.execute('SELECT content FROM article_cache WHERE url = ?', (url,)).fetchone()
+            if row is None and self._has_store:
+                stored = self.conn.execute('SELECT data FROM scraped_articles WHERE link = ?', (url,)).fetchone()
+                if stored:
+                    article = json.loads(stored[0])
+                    if article.get('full_text'):
+                        return {key: article[key] for key in ARTICLE_FIELDS if article.get(key) is not None}
+        return json.loads(row[0]) if row else None
+
+    def set_article(self, url, content):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO article_cache (url, content, cached_at) VALUES (?, ?, ?)',
+                (url, json.dumps(content, ensure_ascii=False), time.time()))
@@ -0,0 +1,66 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+from config import Config
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request."""
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(pool_connections=None, pool_maxsize=None, timeout=None,
+                   max_retries=None, backoff_factor=None):
+    """Build a session with per-host keep-alive pools, retries and compression."""
+    retries = Retry(
+        total=Config.HTTP_MAX_RETRIES if max_retries is None else max_retries,
+        backoff_factor=Config.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=Config.HTTP_TIMEOUT if timeout is None else timeout,
+        pool_connections=pool_connections or Config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize or Config.HTTP_POOL_MAXSIZE,
+        max_retries=retries,
+    )
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Advertises brotli as well when the brotli package is installed
+    session.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+    return session
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
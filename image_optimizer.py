@@ -0,0 +1,99 @@
+"""Resize and re-encode featured images before they are uploaded to WordPress.
+
+Decoding and encoding are CPU bound, so they run in a process pool and the
+publish threads only wait for the result. Enabled with IMAGE_OPTIMIZE.
+"""
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FORMAT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+# Re-encoding these would drop animation or vector data
+SKIPPED_TYPES = {'image/gif', 'image/svg+xml'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def pillow_available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_executor():
+    """Return the process pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: forking a process that already runs publish threads is unsafe
+                _executor = ProcessPoolExecutor(max_workers=Config.IMAGE_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def shrink_image(data, max_width, image_format, quality):
+    """Return (data, content_type) of a copy no wider than `max_width`, re-encoded."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > max_width:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        if image_format == 'jpeg':
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # JPEG has no alpha channel; flatten onto white instead of black
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), quality=quality, optimize=True)
+    return output.getvalue(), FORMAT_TYPES[image_format]
+
+
+def optimize_image(body, content_type):
+    """Return (body, content_type), replaced by a smaller re-encoded copy when there is one.
+
+    `body` is bytes or an open file as returned by wordpress_api.download_image.
+    Anything that cannot be optimized is returned unchanged.
+    """
+    if not Config.IMAGE_OPTIMIZE or content_type in SKIPPED_TYPES:
+        return body, content_type
+    if Config.IMAGE_FORMAT not in FORMAT_TYPES:
+        logger.warning(f"Unsupported IMAGE_FORMAT {Config.IMAGE_FORMAT!r}, uploading original image")
+        return body, content_type
+    if not pillow_available():
+        logger.warning("Pillow is not installed, uploading original image")
+        return body, content_type
+
+    data = body if isinstance(body, bytes) else body.read()
+    try:
+        optimized, optimized_type = get_executor().submit(
+            shrink_image, data, Config.IMAGE_MAX_WIDTH, Config.IMAGE_FORMAT, Config.IMAGE_QUALITY).result()
+    except Exception as e:
+        logger.warning(f"Could not optimize image, uploading original: {str(e)}")
+        optimized = None
+    if not isinstance(body, bytes):
+        body.seek(0)
+
+    if optimized is None or len(optimized) >= len(data):
+        return body, content_type
+    logger.info(f"Optimized image from {len(data)} to {len(optimized)} bytes")
+    return optimized, optimized_type
@@ -0,0 +1,74 @@
+"""Logging setup shared by every entry point, plus helpers for per-article hot paths.
+
+Messages logged once per article use %-style arguments, so nothing is
+formatted unless a handler will emit the record. Scrape and rewrite
+progress goes through log_sampled(), which lets only one in
+LOG_SAMPLE_EVERY through per key; publishing is always logged in full.
+Set LOG_FORMAT=json for one JSON object per line.
+"""
+import json
+import logging
+import threading
+import time
+
+from config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# LogRecord attributes that are not user-supplied extras
+RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed with extra={...} are kept as keys."""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+                    + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=None, fmt=None):
+    """Configure the root logger from LOG_LEVEL and LOG_FORMAT, replacing earlier handlers."""
+    handler = logging.StreamHandler()
+    if (fmt or Config.LOG_FORMAT) == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logging.basicConfig(level=(level or Config.LOG_LEVEL).upper(), handlers=[handler], force=True)
+
+
+class Sampler:
+    """Let the first of every `every` calls through, counted separately per key."""
+
+    def __init__(self, every):
+        self.every = max(1, every)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        if self.every == 1:
+            return True
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+_sampler = Sampler(Config.LOG_SAMPLE_EVERY)
+
+
+def log_sampled(logger, level, key, msg, *args):
+    """Log a noisy per-article message, lazily and only for one in LOG_SAMPLE_EVERY calls per key."""
+    if logger.isEnabledFor(level) and _sampler(key):
+        logger.log(level, msg, *args)
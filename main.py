@@ -1,8 +1,4 @@
-import scraper
-import main_rewriter
-import main_poster
+import pipeline
 
 if __name__ == "__main__":
-    scraper.main()
-    main_rewriter.main()
-    main_poster.main()
\ No newline at end of file
+    pipeline.main()
@@ -1,70 +1,43 @@
 import json
 import logging
 import argparse
-import os
 import time
+import log_utils
+import metrics
+from article_store import ArticleStore
+from batch_rewriter import rewrite_blog_posts_batch
 from blog_rewriter import rewrite_blog_posts
+from dedup import DuplicateIndex, drop_duplicates
 from config_rewriter import (
-    INPUT_FILE, OUTPUT_FILE, CHECK_INTERVAL,
-    check_file_exists, validate_json_file, ensure_directory_exists
+    DATABASE_FILE, CHECK_INTERVAL, REWRITE_BACKEND
 )
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-def update_input_file(file_path, blogs, processed_indices):
-    updated_blogs = [blog for i, blog in enumerate(blogs) if i not in processed_indices]
-    try:
-        ensure_directory_exists(file_path)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(updated_blogs, f, indent=2, ensure_ascii=False)
-        logging.info(f"Successfully updated input file: {file_path}")
-        logging.info(f"Removed {len(processed_indices)} processed blog posts from the input file.")
-    except OSError as e:
-        logging.error(f"Error updating input file {file_path}: {str(e)}")
-        raise
-
-def process_blogs(input_file, output_file):
+def process_blogs(store, backend=REWRITE_BACKEND):
     try:
-        # Check input file
-        check_file_exists(input_file)
-        validate_json_file(input_file)
-
-        # Read input JSON file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            blogs = json.load(f)
+        # Read pending posts from the article store, minus near-duplicates
+        # of anything already scraped, so they cost no rewrite tokens
+        duplicate_index = DuplicateIndex(store.path)
+        try:
+            pending = drop_duplicates(store, duplicate_index, store.pending_articles())
+        finally:
+            duplicate_index.close()
+        blogs = [article for _, article in pending]
 
         if not blogs:
             logging.info("No new blog posts to process.")
             return
 
-        # Rewrite blog posts
-        rewritten_blogs, processed_indices = rewrite_blog_posts(blogs)
+        # Each post is committed as soon as it is rewritten, together with
+        # its status change, so a crash only loses posts still in flight
+        def save_rewritten(i, rewritten_blog):
+            store.add_rewritten(pending[i][0], rewritten_blog)
 
-        # Ensure output directory exists
-        ensure_directory_exists(output_file)
-
-        # Append to output JSON file with UTF-8 encoding and ensure_ascii=False
-        if os.path.exists(output_file):
-            try:
-                with open(output_file, 'r+', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                    existing_data.extend(rewritten_blogs)
-                    f.seek(0)
-                    json.dump(existing_data, f, indent=2, ensure_ascii=False)
-                    f.truncate()
-            except json.JSONDecodeError:
-                logging.error(f"Error parsing existing output file '{output_file}'. Creating a new file.")
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(rewritten_blogs, f, indent=2, ensure_ascii=False)
+        if backend == 'batch':
+            rewritten_blogs, _ = rewrite_blog_posts_batch(blogs, on_rewritten=save_rewritten)
         else:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(rewritten_blogs, f, indent=2, ensure_ascii=False)
-
-        logging.info(f"Successfully rewrote and appended {len(rewritten_blogs)} blog posts to {output_file}")
+            rewritten_blogs, _ = rewrite_blog_posts(blogs, on_rewritten=save_rewritten)
 
-        # Update the input file by removing processed posts
-        update_input_file(input_file, blogs, processed_indices)
+        logging.info(f"Successfully rewrote and saved {len(rewritten_blogs)} blog posts to {store.path}")
 
     except FileNotFoundError as e:
         logging.error(f"File not found: {str(e)}")
@@ -77,18 +50,19 @@ def process_blogs(input_file, output_file):
         raise
 
 def main():
+    log_utils.setup_logging()
     parser = argparse.ArgumentParser(description='Rewrite blog posts using OpenAI API')
-    parser.add_argument('--input', default=INPUT_FILE, help='Input JSON file containing blog posts')
-    parser.add_argument('--output', default=OUTPUT_FILE, help='Output JSON file for rewritten blog posts')
+    parser.add_argument('--database', default=DATABASE_FILE, help='SQLite article store containing scraped blog posts')
+    parser.add_argument('--backend', choices=['sync', 'batch'], default=REWRITE_BACKEND,
+                        help='Send requests one by one (sync) or through the OpenAI Batch API (batch)')
     parser.add_argument('--dry-run', action='store_true', help='Perform a dry run without making API calls')
     args = parser.parse_args()
 
+    store = ArticleStore(args.database)
+
     if args.dry_run:
         try:
-            check_file_exists(args.input)
-            validate_json_file(args.input)
-            with open(args.input, 'r', encoding='utf-8') as f:
-                blogs = json.load(f)
+            blogs = [article for _, article in store.pending_articles()]
             logging.info(f"Dry run: Would process {len(blogs)} blog posts")
             for i, blog in enumerate(blogs, 1):
                 logging.info(f"Blog {i}: Title: {blog['title']}, Content length: {len(blog.get('full_text', ''))}")
@@ -101,9 +75,10 @@ def main():
         except Exception as e:
             logging.error(f"Error during dry run: {str(e)}")
     else:
+        metrics.start_server()
         while True:
             try:
-                process_blogs(args.input, args.output)
+                process_blogs(store, args.backend)
                 logging.info(f"Waiting for {CHECK_INTERVAL // 60} minutes before checking for new content...")
                 time.sleep(CHECK_INTERVAL)
             except KeyboardInterrupt:
@@ -114,5 +89,7 @@ def main():
                 logging.info("Retrying in 60 seconds...")
                 time.sleep(60)
 
+    store.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,272 @@
+"""Process-wide counters, gauges and histograms, served in OpenMetrics text format.
+
+Each module declares its metrics once at import time and updates them on
+the hot path with a dict lookup and an addition under a lock. start_server()
+exposes everything on http://host:port/metrics for Prometheus to scrape.
+
+Spans are optional: with TRACE_FILE set, span() appends one JSON line per
+finished span, and every stage a post passes through shares the trace id
+derived from its link, so a post can be followed from scrape to publish.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# TYPE {self.name} {self.type}", f"# HELP {self.name} {self.documentation}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, func, **labels):
+        """Read the value from func() at scrape time, e.g. a queue's qsize."""
+        self.set(func, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            if callable(value):
+                value = value()
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block. Labels may be changed inside it."""
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_count{labels} {cumulative}"
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Modules run as __main__ and imported again declare metrics twice
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(port=None, host=None):
+    """Serve /metrics from a daemon thread.
+
+    Returns the server, or None when METRICS_PORT is 0 or the port is
+    taken, e.g. by another daemon started with the same METRICS_PORT.
+    """
+    port = Config.METRICS_PORT if port is None else port
+    host = host or Config.METRICS_HOST
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Not serving metrics: cannot listen on {host}:{port} ({e}); "
+                       f"give each daemon its own METRICS_PORT")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+# --- Tracing ---------------------------------------------------------------
+
+_trace_lock = threading.Lock()
+_span_state = threading.local()
+
+
+def trace_id_for(link):
+    """Trace id shared by every span of one post, stable across stages and restarts."""
+    return hashlib.sha256((link or '').encode('utf-8')).hexdigest()[:32]
+
+
+@contextmanager
+def span(name, trace_id, **attributes):
+    """Record a span when TRACE_FILE is set; a no-op otherwise.
+
+    Spans opened inside another span on the same thread become its children.
+    """
+    if not Config.TRACE_FILE:
+        yield attributes
+        return
+    parent = getattr(_span_state, 'current', None)
+    span_id = os.urandom(8).hex()
+    _span_state.current = span_id
+    start_time = time.time()
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield attributes
+    except BaseException as e:
+        status = 'error'
+        attributes['error'] = str(e)
+        raise
+    finally:
+        _span_state.current = parent
+        record = {
+            'trace_id': trace_id,
+            'span_id': span_id,
+            'parent_id': parent,
+            'name': name,
+            'start': start_time,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'status': status,
+            'attributes': attributes,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with _trace_lock, open(Config.TRACE_FILE, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
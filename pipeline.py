@@ -0,0 +1,231 @@
+import logging
+import queue
+import threading
+import time
+import log_utils
+import metrics
+from article_store import ArticleStore
+from blog_poster import publish_post, record_failure
+from blog_rewriter import rewrite_blog_post, make_rewritten_blog
+from config import Config
+from dedup import DuplicateIndex, drop_duplicates
+from scraper import BlogScraper
+from wordpress_api import PublishError
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.gauge('pipeline_queue_depth', 'Items waiting in front of each stage', ['stage'])
+STAGE_ITEMS = metrics.counter('pipeline_items', 'Items handled by each stage, by outcome', ['stage', 'outcome'])
+
+
+class Pipeline:
+    """Scraper -> rewriter -> poster in one process, joined by bounded queues.
+
+    Each stage runs its own worker threads. A full queue blocks the stage
+    feeding it, so a slow rewriter or WordPress holds back scraping instead
+    of growing memory. The article store stays the durable record: every
+    scrape cycle queues again whatever it still holds unfinished, so work
+    that ran out of attempts is retried on the next cycle rather than the
+    next start.
+    """
+
+    def __init__(self, store=None, rewrite_workers=Config.PIPELINE_REWRITE_WORKERS,
+                 publish_workers=Config.PIPELINE_PUBLISH_WORKERS,
+                 queue_size=Config.PIPELINE_QUEUE_SIZE,
+                 scrape_interval=Config.SCRAPE_INTERVAL):
+        self.store = store or ArticleStore()
+        self.duplicate_index = DuplicateIndex(self.store.path)
+        self.rewrite_workers = rewrite_workers
+        self.publish_workers = publish_workers
+        self.scrape_interval = scrape_interval
+        self.rewrite_queue = queue.Queue(maxsize=queue_size)
+        self.publish_queue = queue.Queue(maxsize=queue_size)
+        QUEUE_DEPTH.set_function(self.rewrite_queue.qsize, stage='rewrite')
+        QUEUE_DEPTH.set_function(self.publish_queue.qsize, stage='publish')
+        self.stop_event = threading.Event()
+        self.threads = []
+        # Ids queued, being worked on or waiting for a retry, so a rescan skips them
+        self._rewriting = set()
+        self._publishing = set()
+        # Posts claimed in the ledger while they wait for a retry
+        self._held_claims = set()
+        self._in_flight_lock = threading.Lock()
+
+    def start(self):
+        self._spawn(self.scrape_stage, 'scrape')
+        for i in range(self.rewrite_workers):
+            self._spawn(self.rewrite_stage, f'rewrite-{i}')
+        for i in range(self.publish_workers):
+            self._spawn(self.publish_stage, f'publish-{i}')
+        logger.info(f"Pipeline started with {self.rewrite_workers} rewrite and "
+                    f"{self.publish_workers} publish workers")
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        # Their retry timers will not run; without this the next start would call them uncertain
+        with self._in_flight_lock:
+            held, self._held_claims = self._held_claims, set()
+        self.store.release_claims(held)
+        self.duplicate_index.close()
+        self.store.close()
+        logger.info("Pipeline stopped.")
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _put(self, target_queue, item):
+        # Blocks while the next stage is saturated, but still notices stop()
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source_queue):
+        while not self.stop_event.is_set():
+            try:
+                return source_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _retry_later(self, target_queue, item):
+        timer = threading.Timer(Config.PIPELINE_RETRY_DELAY, self._put, args=(target_queue, item))
+        timer.daemon = True
+        timer.start()
+
+    def _queue(self, target_queue, in_flight, item_id, item):
+        """Queue a first attempt unless the id is already queued or in flight."""
+        with self._in_flight_lock:
+            if item_id in in_flight:
+                return True
+            in_flight.add(item_id)
+        if self._put(target_queue, (item_id, item, 1)):
+            return True
+        self._done(in_flight, item_id)
+        return False
+
+    def _done(self, in_flight, item_id):
+        with self._in_flight_lock:
+            in_flight.discard(item_id)
+
+    def requeue_unfinished(self):
+        """Queue pending articles and pending or failed posts not already queued or in flight."""
+        for post_id, post in self.store.unpublished_posts():
+            if not self._queue(self.publish_queue, self._publishing, post_id, post):
+                return
+        with self._in_flight_lock:
+            rewriting = set(self._rewriting)
+        pending = [(article_id, article) for article_id, article in self.store.pending_articles()
+                   if article_id not in rewriting]
+        for article_id, article in drop_duplicates(self.store, self.duplicate_index, pending):
+            if not self._queue(self.rewrite_queue, self._rewriting, article_id, article):
+                return
+
+    def scrape_stage(self):
+        self.store.recover_interrupted()
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.requeue_unfinished()
+                scraper = BlogScraper()
+                try:
+                    new_blog_posts = scraper.scrape()
+                    inserted = self.store.insert_articles(new_blog_posts)
+                    scraper.record_seen()
+                finally:
+                    scraper.close()
+                unique = drop_duplicates(self.store, self.duplicate_index, inserted)
+                logger.info(f"Scraped {len(new_blog_posts)} posts, {len(inserted)} new, "
+                            f"{len(inserted) - len(unique)} near-duplicates")
+                STAGE_ITEMS.inc(len(unique), stage='scrape', outcome='ok')
+                STAGE_ITEMS.inc(len(inserted) - len(unique), stage='scrape', outcome='duplicate')
+                for article_id, article in unique:
+                    if not self._queue(self.rewrite_queue, self._rewriting, article_id, article):
+                        break
+            except Exception as e:
+                logger.error(f"Error in scrape stage: {str(e)}")
+            self.stop_event.wait(max(0, self.scrape_interval - (time.monotonic() - started)))
+
+    def rewrite_stage(self):
+        while True:
+            item = self._get(self.rewrite_queue)
+            if item is None:
+                return
+            article_id, article, attempt = item
+            try:
+                with metrics.span('rewrite', metrics.trace_id_for(article.get('link')),
+                                  article_id=article_id, attempt=attempt):
+                    if not article.get('full_text'):
+                        raise ValueError(f"Blog post {article['link']} has no content")
+                    rewritten_content = rewrite_blog_post(article['title'], article['full_text'])
+                    post = make_rewritten_blog(article, rewritten_content)
+                    post_id = self.store.add_rewritten(article_id, post)
+                if post_id is not None:
+                    self._queue(self.publish_queue, self._publishing, post_id, post)
+                log_utils.log_sampled(logger, logging.INFO, 'pipeline.rewritten', "Rewrote %s", article['link'])
+                STAGE_ITEMS.inc(stage='rewrite', outcome='ok')
+            except Exception as e:
+                logger.error(f"Error rewriting {article.get('link')} (attempt {attempt}): {str(e)}")
+                STAGE_ITEMS.inc(stage='rewrite', outcome='error')
+                if attempt < Config.PIPELINE_MAX_ATTEMPTS:
+                    self._retry_later(self.rewrite_queue, (article_id, article, attempt + 1))
+                    continue
+            self._done(self._rewriting, article_id)
+
+    def publish_stage(self):
+        while True:
+            item = self._get(self.publish_queue)
+            if item is None:
+                return
+            post_id, post, attempt = item
+            # A retry keeps the claim taken by the first attempt
+            if attempt > 1:
+                with self._in_flight_lock:
+                    self._held_claims.discard(post_id)
+            elif not self.store.claim_post(post_id):
+                self._done(self._publishing, post_id)
+                continue
+            try:
+                wp_post_id = publish_post(post_id, post)
+            except Exception as e:
+                STAGE_ITEMS.inc(stage='publish', outcome='error')
+                # Only requests that never reached WordPress, and 429s, are worth another try
+                if isinstance(e, PublishError) and e.retryable and attempt < Config.PIPELINE_MAX_ATTEMPTS:
+                    logger.error(f"Error publishing post {post_id} (attempt {attempt}): {str(e)}")
+                    with self._in_flight_lock:
+                        self._held_claims.add(post_id)
+                    self._retry_later(self.publish_queue, (post_id, post, attempt + 1))
+                    continue
+                record_failure(self.store, post_id, e)
+            else:
+                STAGE_ITEMS.inc(stage='publish', outcome='ok')
+                self.store.mark_published(post_id, wp_post_id)
+            self._done(self._publishing, post_id)
+
+def main():
+    log_utils.setup_logging()
+
+    if not all([Config.WORDPRESS_URL, Config.WORDPRESS_USERNAME, Config.WORDPRESS_PASSWORD]):
+        logger.error("WordPress configuration is incomplete. Please set WORDPRESS_URL, WORDPRESS_USERNAME, and WORDPRESS_PASSWORD environment variables.")
+        return
+
+    metrics.start_server()
+    pipeline = Pipeline()
+    pipeline.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Stopping pipeline...")
+        pipeline.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import metrics
+
+WAIT_SECONDS = metrics.histogram(
+    'rate_limiter_wait_seconds', 'Time callers spent blocked in RateLimiter.acquire', ['limiter'])
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`.
+
+    reserve() takes tokens immediately, letting the balance go negative,
+    and returns how long the caller must wait before the debt is repaid.
+    Callers are therefore served in the order they reserved.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def drain(self, until, now):
+        """Empty the bucket as of `until`, keeping debts already reserved.
+
+        Refill restarts at `until`, so callers reserving before then are
+        spaced out at the refill rate instead of all waking at `until`.
+        """
+        self.tokens = min(0.0, min(self.capacity, self.tokens + (now - self.updated) * self.rate))
+        self.updated = until
+
+
+class RateLimiter:
+    """Shared limiter for requests/min and tokens/min with a global pause."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, name='openai', burst=None):
+        self.name = name
+        self._lock = threading.Lock()
+        # burst caps how many requests may go out back to back (default: a minute's worth)
+        self.requests = TokenBucket(requests_per_minute, burst)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+
+    def acquire(self, tokens=1):
+        """Block until one request using `tokens` tokens may be sent. Returns the wait."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now),
+                       self.tokens.reserve(tokens, now),
+                       self.paused_until - now)
+        WAIT_SECONDS.observe(max(wait, 0.0), limiter=self.name)
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.0)
+
+    def pause(self, seconds):
+        """Hold back every caller for `seconds`, e.g. after a 429 response."""
+        with self._lock:
+            now = time.monotonic()
+            if now + seconds <= self.paused_until:
+                return
+            self.paused_until = now + seconds
+            self.requests.drain(self.paused_until, now)
+            self.tokens.drain(self.paused_until, now)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+"""
+
+
+class ResponseCache:
+    """Persistent OpenAI response cache keyed by a hash of the request.
+
+    Entries older than `ttl` seconds are ignored and removed; once the cache
+    holds more than `max_entries`, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def make_key(model, prompt, response_format):
+        payload = json.dumps([model, prompt, response_format], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                'SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row and self.ttl is not None and now - row[1] > self.ttl:
+                self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, created_at, last_used) '
+                'VALUES (?, ?, ?, ?)', (key, response, now, now))
+            count = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    'DELETE FROM responses WHERE key IN '
+                    '(SELECT key FROM responses ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            entries = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -1,251 +1,356 @@
+import http_client
 import requests
-from bs4 import BeautifulSoup
+import log_utils
+import metrics
+from article_store import ArticleStore
+from feeds import FeedError, parse_feed
+from http_cache import HttpCache
+from html_parsing import resolve_parser
+from rate_limiter import RateLimiter
+from seen_index import SeenIndex, content_hash
+from site_profiles import SiteProfile
 import json
 import logging
 import schedule
+import threading
 import time
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+FETCH_SECONDS = metrics.histogram(
+    'scraper_fetch_seconds', 'Page fetch latency by host and HTTP status', ['host', 'status'])
+PARSE_SECONDS = metrics.histogram(
+    'scraper_parse_seconds', 'HTML parse and select time by site and page kind', ['site', 'page'])
+
 class BlogScraper:
-    def __init__(self):
+    def __init__(self, config=None):
         self.headers = {
             'User-Agent':
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        with open('config.json', 'r') as f:
-            self.config = json.load(f)
+        if config is None:
+            with open('config.json', 'r') as f:
+                config = json.load(f)
+        self.config = config
+
+        # Parser backend and per-site extraction profiles (see site_profiles.py)
+        self.parser = resolve_parser(self.config.get('parser'))
+        self.profiles = {website['name']: SiteProfile(website, self.parser)
+                         for website in self.config['websites']}
+
+        # Global and per-host limits for concurrent page fetches; a site's
+        # profile may tighten them for its own host
+        self.max_workers = self.config.get('max_workers', 8)
+        self.max_per_host = self.config.get('max_per_host', 4)
+        self.executor = None
+        self._host_rates = {}
+        host_limits = {}
+        for profile in self.profiles.values():
+            if profile.max_per_host:
+                host_limits[profile.host] = min(profile.max_per_host, self.max_per_host,
+                                                host_limits.get(profile.host, self.max_per_host))
+            if profile.requests_per_minute:
+                # No bursts: requests to the host are evenly spaced
+                self._host_rates[profile.host] = RateLimiter(
+                    profile.requests_per_minute, profile.requests_per_minute,
+                    name=f'fetch:{profile.host}', burst=1)
+        self._host_limits = {host: threading.BoundedSemaphore(limit) for host, limit in host_limits.items()}
+        self._host_limits_lock = threading.Lock()
+
+        self.http_cache = HttpCache(self.config.get('article_cache_size', 5000))
+        # Articles already scraped, opened by scrape() and kept open until
+        # record_seen() or close() so that nothing counts as seen before it is saved
+        self.seen_index = None
+        self._pending_validators = []
+        self.seen_index_size = self.config.get('seen_index_size', 10000)
 
     def scrape(self):
+        websites = self.config['websites']
+        if not websites:
+            return []
+
+        self.close_seen_index()
+        self._pending_validators = []
+        self.seen_index = SeenIndex(max_items=self.seen_index_size)
+        for website in websites:
+            self.seen_index.load(website['name'], website['url'])
+
+        # Sites run side by side; their article pages share one bounded pool
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                ThreadPoolExecutor(max_workers=len(websites)) as site_executor:
+            self.executor = executor
+            try:
+                results = list(site_executor.map(self.scrape_website, websites))
+            finally:
+                self.executor = None
+
         all_blog_posts = []
-        for website in self.config['websites']:
-            blog_posts = self.scrape_website(website)
+        for blog_posts in results:
             all_blog_posts.extend(blog_posts)
         return all_blog_posts
 
+    def record_seen(self):
+        """Persist the articles and listing validators the last scrape() saw; call once its articles are stored."""
+        if self.seen_index:
+            self.seen_index.commit()
+        self.close_seen_index()
+        pending, self._pending_validators = self._pending_validators, []
+        for url, response in pending:
+            self.http_cache.store_validators(url, response)
+
+    def close_seen_index(self):
+        if self.seen_index:
+            self.seen_index.close()
+            self.seen_index = None
+
+    def close(self):
+        """Close the caches. Articles of a scrape() never passed to record_seen() are found again next run."""
+        self.close_seen_index()
+        self.http_cache.close()
+
+    def host_limit(self, url):
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            return self._host_limits[host]
+
+    def fetch(self, url, validators=None):
+        """GET a page. With a `validators` list the request is conditional,
+        and a 200's (url, response) is appended for keep_validators()."""
+        headers = self.headers
+        conditional = validators is not None
+        if conditional:
+            headers = {**self.headers, **self.http_cache.conditional_headers(url)}
+        host = urlparse(url).netloc
+        if host in self._host_rates:
+            self._host_rates[host].acquire()
+        with self.host_limit(url):
+            with FETCH_SECONDS.time(host=host, status='error') as labels:
+                response = http_client.get(url, headers=headers)
+                labels['status'] = response.status_code
+        if conditional and response.status_code == 200:
+            validators.append((url, response))
+        return response
+
+    def keep_validators(self, website, validators, complete):
+        """Queue a site's validators for record_seen() only if every new article was read.
+
+        A 304 next run would otherwise hide the articles that failed or
+        were left for later.
+        """
+        if complete:
+            self._pending_validators.extend(validators)
+        elif validators:
+            logger.info(f"Not all new articles on {website['name']} were read; "
+                        f"its listing will be fetched in full next run")
+
+    def map_concurrently(self, func, items):
+        # Results come back in input order, so output order is unchanged
+        if self.executor is None:
+            return [func(item) for item in items]
+        return list(self.executor.map(func, items))
+
     def scrape_website(self, website):
+        """Scrape one site; a failure is logged and costs only that site's articles."""
         logger.info(f"Scraping {website['name']}")
+        try:
+            if self.profiles[website['name']].discovery == 'feed':
+                return self.scrape_feed(website)
+            return self.scrape_listing(website)
+        except Exception as e:
+            logger.error(f"Error scraping {website['name']}: {str(e)}")
+            return []
+
+    def scrape_listing(self, website):
+        """Fetch the articles on the site's listing page not seen on earlier runs."""
         url = website['url']
-        response = requests.get(url, headers=self.headers)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        articles = soup.select(website['article_selector'])
-        logger.info(f"Found {len(articles)} articles on {website['name']}")
+        validators = []
+        response = self.fetch(url, validators)
+        if response.status_code == 304:
+            logger.info(f"{website['name']} listing not modified since last run")
+            return []
+        articles = self.parse_listing(response.content, website)
+
+        # Listing data is cheap, so known articles are dropped before any fetch
+        new_articles = []
+        for article in articles:
+            article_data = self.extract_article_data(article, website)
+            if article_data and not self.seen_index.contains(website['name'], article_data['link']):
+                new_articles.append(article_data)
+        logger.info(f"{len(new_articles)} of {len(articles)} articles on {website['name']} are new")
 
-        blog_posts = []
-        last_scraped_title = self.get_last_scraped_title(website['name'])
+        blog_posts = self.map_concurrently(
+            lambda article_data: self.fetch_article_content(article_data, website),
+            new_articles)
+        self.keep_validators(website, validators, all(post.get('full_text') for post in blog_posts))
+        blog_posts = self.remember(website, [([post['link']], post) for post in blog_posts])
 
-        for i, article in enumerate(articles):
-            article_data = self.extract_article_data(article, website)
-            if article_data:
-                if article_data['title'] == last_scraped_title:
-                    logger.info(
-                        f"Reached last scraped article for {website['name']}")
-                    break
-                blog_posts.append(article_data)
-                logger.info(f"Article {i+1} title: '{article_data['title']}'")
-
-        if blog_posts:
-            self.update_last_scraped_title(website['name'],
-                                           blog_posts[0]['title'])
+        for i, article_data in enumerate(blog_posts):
+            log_utils.log_sampled(logger, logging.INFO, 'scraper.article_title',
+                                  "Article %d title: '%s'", i + 1, article_data['title'])
 
         return blog_posts
 
-    def extract_article_data(self, article, website):
+    def scrape_feed(self, website):
+        """Fetch the articles of feed entries not seen on earlier runs."""
+        profile = self.profiles[website['name']]
+        validators = []
         try:
-            logger.info(f"Extracting data for {website['name']} article")
-
-            title_elem = article.select_one(website['title_selector'])
-            link_elem = article.select_one(website['link_selector'])
-            image_elem = article.select_one(website['image_selector'])
-            date_elem = article.select_one(website['date_selector'])
-
-            logger.debug(f"Title element: {title_elem}")
-            logger.debug(f"Link element: {link_elem}")
-            logger.debug(f"Image element: {image_elem}")
-            logger.debug(f"Date element: {date_elem}")
-
-            if not (title_elem and link_elem):
-                logger.warning(
-                    f"Missing title or link for article in {website['name']}")
-                return None
-
-            title = title_elem.text.strip()
-            link = link_elem['href']
-            if not link.startswith('http'):
-                link = urljoin(website['url'], link)
-
-            image_url = None
-            if image_elem:
-                if 'src' in image_elem.attrs:
-                    image_url = image_elem['src']
-                elif 'data-src' in image_elem.attrs:
-                    image_url = image_elem['data-src']
-                elif 'style' in image_elem.attrs:
-                    style = image_elem['style']
-                    if 'background-image' in style:
-                        image_url = style.split('url(')[1].split(')')[0].strip("'\"")
-            
-            if image_url and not image_url.startswith('http'):
-                image_url = urljoin(website['url'], image_url)
-
-            logger.info(f"Extracted image URL for {website['name']}: {image_url}")
-            
-            if website['name'] == 'Karar':
-                logger.info(f"Karar.com image element: {image_elem}")
-                logger.info(f"Karar.com image element attributes: {image_elem.attrs if image_elem else 'No attributes'}")
-                logger.info(f"Karar.com image URL extraction process:")
-                logger.info(f"  - 'src' in attributes: {'src' in image_elem.attrs if image_elem else False}")
-                logger.info(f"  - 'data-src' in attributes: {'data-src' in image_elem.attrs if image_elem else False}")
-                logger.info(f"  - 'style' in attributes: {'style' in image_elem.attrs if image_elem else False}")
-                if image_elem and 'style' in image_elem.attrs:
-                    logger.info(f"  - Style attribute content: {image_elem['style']}")
-
-            date = date_elem.text.strip() if date_elem else None
-
-            if website['name'] == 'BBC Turkish':
-                category = 10
+            entries = self.fetch_feed_entries(profile.feed_url, website, validators)
+        except (FeedError, requests.exceptions.RequestException) as e:
+            logger.error(f"Error reading feed for {website['name']}: {str(e)}")
+            return []
+
+        new_entries = [entry for entry in entries
+                       if not self.seen_index.contains(website['name'], entry['id'])
+                       and not self.seen_index.contains(website['name'], entry['link'])]
+        logger.info(f"Found {len(entries)} feed entries on {website['name']}, {len(new_entries)} new")
+        truncated = len(new_entries) > profile.feed_max_items
+        new_entries = new_entries[:profile.feed_max_items]
+
+        blog_posts = self.map_concurrently(
+            lambda entry: self.fetch_article_content(profile.feed_article_data(entry), website),
+            new_entries)
+        self.keep_validators(website, validators, not truncated and all(
+            article_data.get('title') and article_data.get('full_text') for article_data in blog_posts))
+
+        return self.remember(website, [({entry['id'], entry['link']}, article_data)
+                                       for entry, article_data in zip(new_entries, blog_posts)
+                                       if article_data.get('title')])
+
+    def remember(self, website, scraped):
+        """Mark (keys, article) pairs as seen and return the articles worth saving.
+
+        Articles whose page could not be read are left out and tried again
+        next run. Articles with the same content as a known one under
+        another link are recorded but not returned.
+        """
+        fresh = []
+        for keys, article_data in scraped:
+            if not article_data.get('full_text'):
+                continue
+            digest = content_hash(article_data)
+            if self.seen_index.contains_content(website['name'], digest):
+                logger.info(f"Skipping {article_data['link']}: same content as an article already scraped")
             else:
-                category = 1
-
-            article_data = {
-                'title': title,
-                'link': link,
-                'image': image_url,
-                'date': date,
-                'categories': category
-            }
-
-            if website['name'] == 'BBC Turkish':
-                article_content = self.parse_bbc_article_content(link)
-            else:
-                article_content = self.parse_article_content(link, website)
-            article_data.update(article_content)
+                fresh.append(article_data)
+            self.seen_index.add(website['name'], keys, digest)
+        return fresh
+
+    def fetch_feed_entries(self, url, website, validators, depth=0):
+        """Entries of a feed or sitemap; a sitemap index is followed one level down."""
+        profile = self.profiles[website['name']]
+        response = self.fetch(url, validators)
+        if response.status_code == 304:
+            logger.info(f"{website['name']} feed {url} not modified since last run")
+            return []
+        response.raise_for_status()
+        with PARSE_SECONDS.time(site=website['name'], page='feed'):
+            kind, entries = parse_feed(response.content, url)
+        if kind != 'sitemapindex':
+            return entries
+        if depth:
+            raise FeedError(f"Nested sitemap index at {url}")
+
+        # Newest child sitemaps first; unchanged ones answer 304
+        sitemaps = sorted(entries, key=lambda sitemap: sitemap['date'] or '', reverse=True)
+        found = []
+        for sitemap in sitemaps[:profile.sitemap_max_children]:
+            found.extend(self.fetch_feed_entries(sitemap['link'], website, validators, depth + 1))
+        return found
+
+    def parse_listing(self, markup, website):
+        with PARSE_SECONDS.time(site=website['name'], page='listing'):
+            return self.profiles[website['name']].parse_listing(markup)
 
-            logger.info(f"Processed article from {website['name']}: {title}")
-            return article_data
+    def extract_article_data(self, article, website):
+        try:
+            logger.debug("Extracting data for %s article", website['name'])
+            return self.profiles[website['name']].extract_article_data(article)
         except Exception as e:
             logger.error(
                 f"Error in extract_article_data for {website['name']}: {str(e)}"
             )
             return None
 
-    def parse_bbc_article_content(self, article_url):
-        try:
-            response = requests.get(article_url, headers=self.headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            main_content = soup.select_one('main[role="main"]')
-
-            if main_content:
-                content_blocks = main_content.find_all(
-                    ['p', 'h2', 'h3', 'ul', 'ol'])
-                full_text = '\n'.join([
-                    block.get_text(strip=True) for block in content_blocks
-                    if block.get_text(strip=True)
-                ])
-                logger.info(
-                    f"Extracted full text (first 200 characters): {full_text[:200]}..."
-                )
+    def fetch_article_content(self, article_data, website):
+        link = article_data['link']
+        with metrics.span('scrape', metrics.trace_id_for(link), site=website['name'], link=link) as attributes:
+            article_content = self.http_cache.get_article(link)
+            attributes['cached'] = article_content is not None
+            if article_content is not None:
+                log_utils.log_sampled(logger, logging.INFO, 'scraper.cached',
+                                      "Using cached content for %s", link)
             else:
-                full_text = "Content not found"
-                logger.warning(
-                    "Main content element not found in BBC Turkish article")
-
-            tags = soup.select("li.bbc-1msyfg1")
-            logger.info(
-                f"Extracted tags: {[tag.text.strip() for tag in tags]}")
-
-            return {
-                'full_text': full_text,
-                'tags': [tag.text.strip() for tag in tags] if tags else []
-            }
-        except Exception as e:
-            logger.error(
-                f"Error parsing BBC article content for {article_url}: {str(e)}"
-            )
-            return {}
-
-    def parse_article_content(self, article_url, website):
+                # Feed entries may lack a headline or image; take them from the page
+                missing = [key for key in ('title', 'image') if not article_data.get(key)]
+                article_content = self.parse_article_content(link, website, missing)
+                if article_content:
+                    self.http_cache.set_article(link, article_content)
+        article_data.update(article_content)
+
+        log_utils.log_sampled(logger, logging.INFO, 'scraper.processed',
+                              "Processed article from %s: %s", website['name'], article_data['title'])
+        return article_data
+
+    def parse_article_content(self, article_url, website, metadata=()):
+        """Fetch and extract an article, adding the `metadata` fields ('title', 'image') found on the page."""
         if not article_url:
             return {}
 
         try:
-            response = requests.get(article_url, headers=self.headers)
+            response = self.fetch(article_url)
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
         except Exception as e:
             logger.error(f"Error fetching article {article_url}: {str(e)}")
             return {}
 
-        article_content = soup.select_one(website['content_selector'])
-
+        article_content = self.extract_article_content(response.content, website)
         if not article_content:
             logger.warning(f"Could not find article content for {article_url}")
-            return {}
-
-        text_content = article_content.select(website['text_content_selector'])
-        full_text = '\n'.join([p.text.strip() for p in text_content])
-        tags = article_content.select(website['tag_selector'])
-
-        return {
-            'full_text': full_text,
-            'tags': [tag.text.strip() for tag in tags] if tags else []
-        }
-
-    def get_last_scraped_title(self, website_name):
+        elif metadata:
+            page = self.profiles[website['name']].extract_page_metadata(response.content, article_url)
+            article_content.update({key: page[key] for key in metadata if page.get(key)})
+        return article_content
+
+    def extract_article_content(self, markup, website):
+        """Extract full text and tags with the site's content strategy."""
+        with PARSE_SECONDS.time(site=website['name'], page='article'):
+            return self.profiles[website['name']].extract_content(markup)
+
+    def save_articles(self, new_data, store=None):
+        own_store = store is None
+        store = store or ArticleStore()
         try:
-            with open('last_scraped_titles.json', 'r') as f:
-                last_scraped_titles = json.load(f)
-            return last_scraped_titles.get(website_name, '')
-        except (FileNotFoundError, json.JSONDecodeError):
-            return ''
-
-    def update_last_scraped_title(self, website_name, title):
-        try:
-            with open('last_scraped_titles.json', 'r') as f:
-                last_scraped_titles = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            last_scraped_titles = {}
-
-        last_scraped_titles[website_name] = title
-
-        with open('last_scraped_titles.json', 'w') as f:
-            json.dump(last_scraped_titles, f)
-
-    def save_to_json(self, new_data, filename='scraped_data.json'):
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_data = []
-
-        merged_data = existing_data.copy()
-        for article in new_data:
-            if not any(existing['link'] == article['link']
-                       for existing in existing_data):
-                merged_data.append(article)
-
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(merged_data, f, indent=2, ensure_ascii=False)
-        logger.info(f"Data saved to {filename}")
+            inserted = store.add_articles(new_data)
+        finally:
+            if own_store:
+                store.close()
+        logger.info(f"Saved {inserted} new articles to {store.path}")
+        return inserted
 
 def run_scraper():
     scraper = BlogScraper()
     try:
         new_blog_posts = scraper.scrape()
-        scraper.save_to_json(new_blog_posts)
+        scraper.save_articles(new_blog_posts)
+        scraper.record_seen()
         logger.info(
             f"Successfully scraped {len(new_blog_posts)} new blog posts from multiple websites"
         )
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
+    finally:
+        scraper.close()
 
 def main():
+    log_utils.setup_logging()
     logger.info("Starting the scraper scheduler")
+    metrics.start_server()
     schedule.every(1).hour.do(run_scraper)
 
     run_scraper()
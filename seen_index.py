@@ -0,0 +1,169 @@
+"""Per-site record of articles already scraped, so their pages are never fetched again.
+
+Links (and feed entry ids) plus a hash of each article's content are kept
+in the article database, at most `max_items` per site. Each run loads
+them once into one Bloom filter per site. A miss in the filter means the
+article is new without touching the disk. A hit is confirmed with one
+indexed lookup, because a false positive would otherwise hide a new
+article on every run.
+
+Articles added during a run are held in memory until commit(), which the
+caller runs once the articles themselves are stored. An article lost to
+a crash in between is therefore scraped again instead of skipped forever.
+"""
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_items (
+    site TEXT NOT NULL,
+    key TEXT NOT NULL,
+    content_hash TEXT,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (site, key)
+);
+CREATE INDEX IF NOT EXISTS idx_seen_items_hash ON seen_items (site, content_hash);
+CREATE INDEX IF NOT EXISTS idx_seen_items_age ON seen_items (site, seen_at);
+"""
+
+
+def content_hash(article):
+    text = f"{article.get('title') or ''}\n{article.get('full_text') or ''}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenIndex:
+    def __init__(self, path=None, max_items=10000):
+        self.path = path or Config.DATABASE_PATH
+        self.max_items = max_items
+        self._filters = {}
+        # Added but not yet committed: site -> {key: digest, "sha256:<digest>": None}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def load(self, site, site_url=None):
+        """Build the site's Bloom filter, seeding an empty index from already stored articles."""
+        with self._lock, self.conn:
+            count = self.conn.execute('SELECT COUNT(*) FROM seen_items WHERE site = ?', (site,)).fetchone()[0]
+            if count == 0 and site_url:
+                count = self._seed(site, site_url)
+            bloom = BloomFilter(max(self.max_items, count))
+            for key, digest in self.conn.execute(
+                    'SELECT key, content_hash FROM seen_items WHERE site = ?', (site,)):
+                bloom.add(key)
+                if digest:
+                    bloom.add(f"sha256:{digest}")
+            self._filters[site] = bloom
+        return count
+
+    def _seed(self, site, site_url):
+        # Replaces last_scraped_titles.json: every article already in the
+        # store from this site's host counts as seen
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'scraped_articles' not in tables:
+            return 0
+        parsed = urlparse(site_url)
+        prefix = f"{parsed.scheme}://{parsed.netloc}/"
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO seen_items (site, key, content_hash, seen_at) '
+            'SELECT ?, link, NULL, scraped_at FROM scraped_articles '
+            'WHERE substr(link, 1, ?) = ? ORDER BY id DESC LIMIT ?',
+            (site, len(prefix), prefix, self.max_items))
+        return cursor.rowcount
+
+    def _filter(self, site):
+        if site not in self._filters:
+            self.load(site)
+        return self._filters[site]
+
+    def contains(self, site, key):
+        if key not in self._filter(site):
+            return False
+        with self._lock:
+            if key in self._pending.get(site, ()):
+                return True
+            row = self.conn.execute(
+                'SELECT 1 FROM seen_items WHERE site = ? AND key = ?', (site, key)).fetchone()
+        return row is not None
+
+    def contains_content(self, site, digest):
+        if f"sha256:{digest}" not in self._filter(site):
+            return False
+        with self._lock:
+            if f"sha256:{digest}" in self._pending.get(site, ()):
+                return True
+            row = self.conn.execute(
+                'SELECT 1 FROM seen_items WHERE site = ? AND content_hash = ?', (site, digest)).fetchone()
+        return row is not None
+
+    def add(self, site, keys, digest=None):
+        """Mark an article seen under each of `keys` (its link, feed id, ...) until commit()."""
+        bloom = self._filter(site)
+        with self._lock:
+            pending = self._pending.setdefault(site, {})
+            for key in keys:
+                pending[key] = digest
+                bloom.add(key)
+            if digest:
+                pending[f"sha256:{digest}"] = None
+                bloom.add(f"sha256:{digest}")
+
+    def commit(self):
+        """Write the articles added since the last commit and prune each site. Returns how many keys were written."""
+        now = time.time()
+        with self._lock, self.conn:
+            rows = [(site, key, digest, now)
+                    for site, pending in self._pending.items()
+                    for key, digest in pending.items() if not key.startswith('sha256:')]
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO seen_items (site, key, content_hash, seen_at) VALUES (?, ?, ?, ?)', rows)
+            for site in self._pending:
+                self._prune(site)
+            self._pending = {}
+        return len(rows)
+
+    def _prune(self, site):
+        return self.conn.execute(
+            'DELETE FROM seen_items WHERE site = ? AND key NOT IN '
+            '(SELECT key FROM seen_items WHERE site = ? ORDER BY seen_at DESC LIMIT ?)',
+            (site, site, self.max_items)).rowcount
+
+    def prune(self, site):
+        """Drop the oldest entries of a site beyond max_items. Returns how many were dropped."""
+        with self._lock, self.conn:
+            return self._prune(site)
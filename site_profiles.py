@@ -0,0 +1,207 @@
+"""Per-site extraction profiles, compiled once from the `websites` entries of config.json.
+
+Besides its selectors, a site entry may set:
+
+    content_strategy     "selector" (default): text_content_selector and
+                         tag_selector matches inside content_selector.
+                         "main_blocks": every block_tags element inside
+                         main_selector, tags from anywhere on the page.
+    category             WordPress category id for its posts (default 1)
+    image_attributes     image_selector attributes tried in order for the
+                         image URL; "style" reads a background-image url()
+    max_per_host         concurrent fetches from the site's host, at most
+                         the global max_per_host
+    requests_per_minute  cap on fetches from the site's host
+    discovery            "listing" (default) finds articles on the `url`
+                         page; "feed" reads feed_url instead, an RSS, Atom,
+                         sitemap or sitemap index document (see feeds.py)
+    feed_max_items       new feed entries fetched per run (default 50)
+    sitemap_max_children most recent child sitemaps read from an index
+                         (default 3)
+
+Adding a site that fits one of the strategies needs no code changes.
+"""
+import logging
+from urllib.parse import urljoin, urlparse
+
+from bs4 import SoupStrainer
+
+from html_parsing import compile_selectors, parse_html, strainer_for, tag_strainer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY = 1
+DEFAULT_IMAGE_ATTRIBUTES = ('src', 'data-src', 'style')
+DEFAULT_MAIN_SELECTOR = 'main[role="main"]'
+DEFAULT_BLOCK_TAGS = ('p', 'h2', 'h3', 'ul', 'ol')
+DISCOVERY_MODES = ('listing', 'feed')
+METADATA_STRAINER = SoupStrainer(['title', 'meta'])
+
+
+def style_image_url(style):
+    if 'background-image' not in style:
+        return None
+    return style.split('url(')[1].split(')')[0].strip("'\"")
+
+
+class SiteProfile:
+    def __init__(self, website, parser):
+        self.website = website
+        self.name = website['name']
+        self.url = website['url']
+        self.host = urlparse(self.url).netloc
+        self.parser = parser
+        self.category = website.get('category', DEFAULT_CATEGORY)
+        self.image_attributes = tuple(website.get('image_attributes', DEFAULT_IMAGE_ATTRIBUTES))
+        self.max_per_host = website.get('max_per_host')
+        self.requests_per_minute = website.get('requests_per_minute')
+
+        self.discovery = website.get('discovery', 'listing')
+        if self.discovery not in DISCOVERY_MODES:
+            raise ValueError(f"Unknown discovery {self.discovery!r} for {self.name}; "
+                             f"expected one of {list(DISCOVERY_MODES)}")
+        self.feed_url = website.get('feed_url')
+        if self.discovery == 'feed' and not self.feed_url:
+            raise ValueError(f"{self.name} uses feed discovery but has no feed_url")
+        self.feed_max_items = website.get('feed_max_items', 50)
+        self.sitemap_max_children = website.get('sitemap_max_children', 3)
+
+        strategy = website.get('content_strategy', 'selector')
+        if strategy not in CONTENT_STRATEGIES:
+            raise ValueError(f"Unknown content_strategy {strategy!r} for {self.name}; "
+                             f"expected one of {sorted(CONTENT_STRATEGIES)}")
+        self.content_strategy = strategy
+        # Bound once, so extracting an article never dispatches on the strategy name
+        self.extract_content = getattr(self, CONTENT_STRATEGIES[strategy])
+
+        if strategy == 'main_blocks':
+            website = {'main_selector': DEFAULT_MAIN_SELECTOR, **website}
+            self.block_tags = list(website.get('block_tags', DEFAULT_BLOCK_TAGS))
+        self.selectors = compile_selectors(website)
+
+        parse_only = website.get('parse_only', False)
+        self.listing_strainer = strainer_for(website['article_selector']) if parse_only else None
+        if not parse_only:
+            self.content_strainer = None
+        elif strategy == 'main_blocks':
+            # Tags may sit outside the main element
+            self.content_strainer = tag_strainer([website['main_selector'], website['tag_selector']])
+        else:
+            self.content_strainer = strainer_for(website['content_selector'])
+
+    def parse_listing(self, markup):
+        soup = parse_html(markup, self.parser, self.listing_strainer)
+        return self.selectors['article_selector'].select(soup)
+
+    def image_url(self, image_elem):
+        for attribute in self.image_attributes:
+            if attribute in image_elem.attrs:
+                value = image_elem[attribute]
+                return style_image_url(value) if attribute == 'style' else value
+        return None
+
+    def extract_article_data(self, article):
+        """Return the listing fields of one article element, or None without a title and link."""
+        title_elem = self.selectors['title_selector'].select_one(article)
+        link_elem = self.selectors['link_selector'].select_one(article)
+        image_elem = self.selectors['image_selector'].select_one(article)
+        date_elem = self.selectors['date_selector'].select_one(article)
+
+        logger.debug("Title element: %s", title_elem)
+        logger.debug("Link element: %s", link_elem)
+        logger.debug("Image element: %s", image_elem)
+        logger.debug("Date element: %s", date_elem)
+
+        if not (title_elem and link_elem):
+            logger.warning(f"Missing title or link for article in {self.name}")
+            return None
+
+        link = link_elem['href']
+        if not link.startswith('http'):
+            link = urljoin(self.url, link)
+
+        image_url = self.image_url(image_elem) if image_elem else None
+        if image_url and not image_url.startswith('http'):
+            image_url = urljoin(self.url, image_url)
+        logger.debug("Extracted image URL for %s: %s", self.name, image_url)
+
+        return {
+            'title': title_elem.text.strip(),
+            'link': link,
+            'image': image_url,
+            'date': date_elem.text.strip() if date_elem else None,
+            'categories': self.category
+        }
+
+    def feed_article_data(self, entry):
+        """Article data for a feed entry; title and image may be None until the page is read."""
+        image = entry['image']
+        if image and not image.startswith('http'):
+            image = urljoin(self.url, image)
+        return {
+            'title': entry['title'],
+            'link': entry['link'],
+            'image': image,
+            'date': entry['date'],
+            'categories': self.category
+        }
+
+    def extract_page_metadata(self, markup, base_url):
+        """Title and image of an article page from its Open Graph tags or <title>."""
+        soup = parse_html(markup, self.parser, METADATA_STRAINER)
+        og_title = soup.find('meta', attrs={'property': 'og:title'})
+        og_image = soup.find('meta', attrs={'property': 'og:image'})
+        title = og_title.get('content') if og_title else None
+        if not title and soup.title:
+            title = soup.title.get_text()
+        image = og_image.get('content') if og_image else None
+        return {
+            'title': title.strip() if title else None,
+            'image': urljoin(base_url, image) if image else None,
+        }
+
+    def extract_selector_content(self, markup):
+        soup = parse_html(markup, self.parser, self.content_strainer)
+        article_content = self.selectors['content_selector'].select_one(soup)
+
+        if not article_content:
+            return {}
+
+        text_content = self.selectors['text_content_selector'].select(article_content)
+        full_text = '\n'.join([p.text.strip() for p in text_content])
+        tags = self.selectors['tag_selector'].select(article_content)
+
+        return {
+            'full_text': full_text,
+            'tags': [tag.text.strip() for tag in tags] if tags else []
+        }
+
+    def extract_main_blocks_content(self, markup):
+        soup = parse_html(markup, self.parser, self.content_strainer)
+        main_content = self.selectors['main_selector'].select_one(soup)
+
+        if main_content:
+            content_blocks = main_content.find_all(self.block_tags)
+            full_text = '\n'.join([
+                block.get_text(strip=True) for block in content_blocks
+                if block.get_text(strip=True)
+            ])
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Extracted full text (first 200 characters): %s...", full_text[:200])
+        else:
+            full_text = "Content not found"
+            logger.warning(f"Main content element not found in {self.name} article")
+
+        tags = [tag.text.strip() for tag in self.selectors['tag_selector'].select(soup)]
+        logger.debug("Extracted tags: %s", tags)
+
+        return {
+            'full_text': full_text,
+            'tags': tags
+        }
+
+
+CONTENT_STRATEGIES = {
+    'selector': 'extract_selector_content',
+    'main_blocks': 'extract_main_blocks_content',
+}
@@ -0,0 +1,263 @@
+"""Local stand-in for the parts of the OpenAI API the rewriter uses.
+
+Implements chat completions, file upload/download and the Batch API with
+canned JSON replies, so the rewriter can be exercised without a real key.
+Chat completions can be slowed down and made to fail with 429s to mimic
+a loaded account:
+
+    python -m stubs.openai_server --port 8800
+    OPENAI_BASE_URL=http://127.0.0.1:8800/v1 OPENAI_API_KEY=test \\
+        python main_rewriter.py --backend batch
+"""
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ids = itertools.count(1)
+
+
+def fake_reply(prompt):
+    """Build a JSON reply with the keys the rewriter prompt asks for."""
+    title = re.search(r'Orijinal Başlık: (.*)', prompt)
+    chunk = re.search(r'Orijinal İçerik Parçası:\n(.*?)\n\nYeniden', prompt, re.S)
+    reply = {}
+    if "'title'" in prompt:
+        reply['title'] = f"Yeniden: {title.group(1) if title else ''}"
+    if "'content'" in prompt:
+        reply['content'] = f"Yeniden yazıldı: {chunk.group(1) if chunk else prompt}"
+    return json.dumps(reply, ensure_ascii=False)
+
+
+def chat_completion(body):
+    prompt = body['messages'][-1]['content']
+    content = fake_reply(prompt)
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        'id': f"chatcmpl-{next(_ids)}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'gpt-4o-mini'),
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content},
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class OpenAIState:
+    def __init__(self, batch_delay=1.0, latency=0.0, error_rate=0.0, retry_after=0.5):
+        self.batch_delay = batch_delay
+        # Seconds per chat completion, and the share answered with a 429
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random()
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, filename, content, purpose):
+        file_id = f"file-{next(_ids)}"
+        record = {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(content),
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose,
+            'status': 'processed',
+        }
+        with self.lock:
+            self.files[file_id] = (record, content)
+        return record
+
+    def create_batch(self, body):
+        batch_id = f"batch_{next(_ids)}"
+        batch = {
+            'id': batch_id,
+            'object': 'batch',
+            'endpoint': body['endpoint'],
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'created_at': int(time.time()),
+            'output_file_id': None,
+            'error_file_id': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        return batch
+
+    def cancel_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch['status'] == 'in_progress':
+                batch['status'] = 'cancelled'
+            return dict(batch)
+
+    def _run_batch(self, batch_id):
+        time.sleep(self.batch_delay)
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch['status'] == 'cancelled':
+                return
+            _, content = self.files[batch['input_file_id']]
+
+        lines = [json.loads(line) for line in content.decode('utf-8').splitlines() if line.strip()]
+        output, errors = [], []
+        for request in lines:
+            if request.get('url') != '/v1/chat/completions':
+                # Like the real API, requests that cannot run go to the error file
+                errors.append(json.dumps({
+                    'id': f"batch_req_{next(_ids)}",
+                    'custom_id': request.get('custom_id'),
+                    'response': None,
+                    'error': {'code': 'invalid_url', 'message': f"Unsupported url {request.get('url')!r}"},
+                }))
+                continue
+            output.append(json.dumps({
+                'id': f"batch_req_{next(_ids)}",
+                'custom_id': request['custom_id'],
+                'response': {'status_code': 200, 'request_id': '', 'body': chat_completion(request['body'])},
+                'error': None,
+            }, ensure_ascii=False))
+
+        output_file = self.add_file(f"{batch_id}_output.jsonl",
+                                    ('\n'.join(output) + '\n').encode('utf-8'), 'batch_output')
+        error_file = self.add_file(f"{batch_id}_errors.jsonl",
+                                   ('\n'.join(errors) + '\n').encode('utf-8'), 'batch_output') if errors else None
+        with self.lock:
+            batch.update({
+                'status': 'completed',
+                'output_file_id': output_file['id'],
+                'error_file_id': error_file['id'] if error_file else None,
+                'completed_at': int(time.time()),
+                'request_counts': {'total': len(lines), 'completed': len(output), 'failed': len(errors)},
+            })
+
+
+class OpenAIHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        if path == '/v1/chat/completions':
+            self.handle_chat_completion(json.loads(self.read_body()))
+        elif path == '/v1/files':
+            self.send_json(200, self.handle_upload())
+        elif path == '/v1/batches':
+            self.send_json(200, self.state.create_batch(json.loads(self.read_body())))
+        elif re.fullmatch(r'/v1/batches/[\w-]+/cancel', path) and path.split('/')[3] in self.state.batches:
+            self.send_json(200, self.state.cancel_batch(path.split('/')[3]))
+        else:
+            self.send_json(404, {'error': {'message': f"Unknown path {path}"}})
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        match = re.fullmatch(r'/v1/batches/([\w-]+)', path)
+        if match and match.group(1) in self.state.batches:
+            with self.state.lock:
+                self.send_json(200, dict(self.state.batches[match.group(1)]))
+            return
+        match = re.fullmatch(r'/v1/files/([\w-]+)/content', path)
+        if match and match.group(1) in self.state.files:
+            _, content = self.state.files[match.group(1)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        self.send_json(404, {'error': {'message': f"Unknown path {path}"}})
+
+    def handle_chat_completion(self, body):
+        state = self.state
+        time.sleep(state.latency)
+        with state.lock:
+            rate_limited = state.error_rate and state.random.random() < state.error_rate
+        if rate_limited:
+            self.send_json(429, {'error': {
+                'message': 'Rate limit reached for requests',
+                'type': 'requests',
+                'code': 'rate_limit_exceeded',
+            }}, headers={'retry-after-ms': str(int(state.retry_after * 1000))})
+            return
+        self.send_json(200, chat_completion(body))
+
+    def handle_upload(self):
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8')
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + self.read_body())
+        fields = {}
+        filename = 'upload.jsonl'
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            fields[name] = part.get_payload(decode=True)
+            if name == 'file':
+                filename = part.get_filename() or filename
+        return self.state.add_file(filename, fields.get('file', b''),
+                                   fields.get('purpose', b'batch').decode('utf-8'))
+
+
+def make_server(host='127.0.0.1', port=8800, batch_delay=1.0, latency=0.0, error_rate=0.0, retry_after=0.5):
+    state = OpenAIState(batch_delay, latency, error_rate, retry_after)
+    handler = type('Handler', (OpenAIHandler,), {'state': state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the OpenAI API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--batch-delay', type=float, default=1.0,
+                        help='Seconds before a submitted batch completes')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds before each chat completion is answered')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Share of chat completions answered with 429 (0-1)')
+    parser.add_argument('--retry-after', type=float, default=0.5,
+                        help='Seconds sent as retry-after-ms with each 429')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.batch_delay, args.latency, args.error_rate, args.retry_after)
+    # Reports the real port, so callers can pass --port 0 and read it back
+    print(f"OpenAI stand-in listening on http://{args.host}:{server.server_port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
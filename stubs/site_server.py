@@ -0,0 +1,51 @@
+"""Local stand-in for the news sites the scraper reads.
+
+Serves a directory of saved or generated listing and article pages, with
+an optional delay per request, so BlogScraper can be run offline:
+
+    python -m stubs.site_server --root /tmp/site --port 8765
+
+benchmarks/bench_pipeline.py builds such a directory and points a copy of
+config.json at it.
+"""
+import argparse
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SiteHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+
+def make_server(root, host='127.0.0.1', port=8765, latency=0.0):
+    handler = type('Handler', (SiteHandler,), {'latency': latency})
+    return ThreadingHTTPServer((host, port), partial(handler, directory=root))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve saved news pages for the scraper')
+    parser.add_argument('--root', required=True, help='Directory with the pages to serve')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    args = parser.parse_args()
+
+    server = make_server(args.root, args.host, args.port, args.latency)
+    # Reports the real port, so callers can pass --port 0 and read it back
+    print(f"Site stand-in listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
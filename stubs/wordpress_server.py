@@ -0,0 +1,175 @@
+"""Local stand-in for the WordPress REST endpoints the poster uses.
+
+Accepts posts (singly or through /wp-json/batch/v1) and media uploads with
+optional latency and a bandwidth cap on uploads, so publishing can be
+exercised and timed without a live site:
+
+    python -m stubs.wordpress_server --port 8900
+    WORDPRESS_URL=http://127.0.0.1:8900 WORDPRESS_USERNAME=u WORDPRESS_PASSWORD=p \\
+        python blog_poster.py
+
+GET /stub/stats returns what has been received so far.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+READ_CHUNK_SIZE = 64 * 1024
+BATCH_MAX_REQUESTS = 25
+
+
+class WordPressState:
+    def __init__(self, latency=0.0, upload_bandwidth=0, batch=True):
+        self.latency = latency
+        # False behaves like WordPress before 5.6, which has no batch endpoint
+        self.batch = batch
+        # Bytes per second for request bodies, 0 for unlimited
+        self.upload_bandwidth = upload_bandwidth
+        self.ids = itertools.count(1)
+        self.posts = []
+        self.media = []
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def create_post(self, body):
+        """Return (status, payload) like POST /wp/v2/posts."""
+        if not any(body.get(field) for field in ('title', 'content', 'excerpt')):
+            return 400, {'code': 'empty_content', 'message': 'Content, title, and excerpt are empty.',
+                         'data': {'status': 400}}
+        return 201, self.add_post(body)
+
+    def add_post(self, body):
+        with self.lock:
+            post = dict(body, id=next(self.ids))
+            self.posts.append(post)
+        return post
+
+    def add_media(self, content_type, filename, size):
+        with self.lock:
+            media = {'id': next(self.ids), 'mime_type': content_type, 'filename': filename, 'bytes': size}
+            self.media.append(media)
+        return media
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'posts': len(self.posts),
+                'media': len(self.media),
+                'media_bytes': sum(media['bytes'] for media in self.media),
+            }
+
+
+class WordPressHandler(BaseHTTPRequestHandler):
+    state = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        chunks = []
+        while remaining > 0:
+            chunk = self.rfile.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            if self.state.upload_bandwidth:
+                time.sleep(len(chunk) / self.state.upload_bandwidth)
+        return b''.join(chunks)
+
+    def authorized(self):
+        if self.headers.get('Authorization', '').startswith('Basic '):
+            return True
+        self.read_body()
+        self.send_json(401, {'code': 'rest_not_logged_in', 'message': 'You are not currently logged in.'})
+        return False
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if not self.authorized():
+            return
+        body = self.read_body()
+        self.state.count_request()
+        time.sleep(self.state.latency)
+        if path == '/wp-json/wp/v2/posts':
+            self.send_json(*self.state.create_post(json.loads(body)))
+        elif path == '/wp-json/batch/v1' and self.state.batch:
+            self.handle_batch(json.loads(body))
+        elif path == '/wp-json/wp/v2/media':
+            disposition = self.headers.get('Content-Disposition', '')
+            filename = disposition.split('filename=')[-1].strip('"') if 'filename=' in disposition else ''
+            self.send_json(201, self.state.add_media(self.headers.get('Content-Type'), filename, len(body)))
+        else:
+            self.send_json(404, {'code': 'rest_no_route', 'message': f"No route was found matching {path}"})
+
+    def handle_batch(self, body):
+        requests = body.get('requests', [])
+        if len(requests) > BATCH_MAX_REQUESTS:
+            self.send_json(400, {'code': 'rest_batch_too_many_requests',
+                                 'message': f"Maximum number of requests is {BATCH_MAX_REQUESTS}.",
+                                 'data': {'status': 400}})
+            return
+        responses = []
+        for request in requests:
+            if request.get('method', 'POST') == 'POST' and request.get('path', '').rstrip('/') == '/wp/v2/posts':
+                status, payload = self.state.create_post(request.get('body', {}))
+            else:
+                status, payload = 404, {'code': 'rest_no_route', 'message': 'No route was found.'}
+            responses.append({'body': payload, 'status': status, 'headers': {}})
+        self.send_json(207, {'responses': responses})
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path == '/stub/stats':
+            self.send_json(200, self.state.stats())
+        else:
+            self.send_json(404, {'code': 'rest_no_route', 'message': f"No route was found matching {path}"})
+
+
+def make_server(host='127.0.0.1', port=8900, latency=0.0, upload_bandwidth=0, batch=True):
+    handler = type('Handler', (WordPressHandler,),
+                   {'state': WordPressState(latency, upload_bandwidth, batch)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the WordPress REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every request')
+    parser.add_argument('--upload-bandwidth', type=int, default=0,
+                        help='Cap on request body throughput in bytes per second (0: unlimited)')
+    parser.add_argument('--no-batch', action='store_true',
+                        help='Answer /wp-json/batch/v1 with 404, like WordPress before 5.6')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.upload_bandwidth, not args.no_batch)
+    # Reports the real port, so callers can pass --port 0 and read it back
+    print(f"WordPress stand-in listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,109 @@
 import requests
+import urllib3
+import http_client
+import metrics
 import base64
+import functools
+import hashlib
 import json
+import mimetypes
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+from article_store import ArticleStore
 from config import Config
+from image_optimizer import optimize_image
 import logging
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+IMAGE_CHUNK_SIZE = 64 * 1024
+# Images up to this size stay in memory; larger ones spill to a temp file
+IMAGE_SPOOL_SIZE = 1024 * 1024
 
-def post_to_wordpress(post_data):
-    url = f"{Config.WORDPRESS_URL}/wp-json/wp/v2/posts"
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+REQUEST_SECONDS = metrics.histogram(
+    'wordpress_request_seconds', 'WordPress REST request latency by endpoint and HTTP status',
+    ['endpoint', 'status'])
+
+_media_store = None
+_media_store_lock = threading.Lock()
+# image URL -> [lock, users]; an entry lives only while an upload of that URL is under way
+_upload_locks = {}
+_upload_locks_lock = threading.Lock()
+# Cleared on the first 404 from /wp-json/batch/v1
+_batch_supported = True
+
+
+class PublishError(Exception):
+    """A post was not created, as far as we know.
+
+    `retryable` is False when sending it again cannot help. `uncertain`
+    is True when WordPress may have created it anyway, so it must not be
+    sent again without checking.
+    """
+
+    def __init__(self, message, retryable, uncertain=False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.uncertain = uncertain
+
+
+def never_sent(error):
+    """True when a request failed before WordPress could have received it."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+def publish_error(error, message):
+    """PublishError for a failed create request.
+
+    Only a request that never reached WordPress, or a 429, is retried. A
+    read timeout, dropped connection or 5xx may come after WordPress
+    created the post, so those are uncertain; other 4xx are final.
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        if never_sent(error):
+            return PublishError(message, retryable=True)
+        return PublishError(message, retryable=False, uncertain=True)
+    if response.status_code == 429:
+        return PublishError(message, retryable=True)
+    return PublishError(message, retryable=False, uncertain=response.status_code >= 500)
+
+
+@functools.lru_cache(maxsize=4)
+def _basic_auth(username, password):
+    token = base64.b64encode(f"{username}:{password}".encode()).decode('utf-8')
+    return f"Basic {token}"
 
-    # Create base64 encoded credentials
-    credentials = Config.WORDPRESS_USERNAME + ':' + Config.WORDPRESS_PASSWORD
-    token = base64.b64encode(credentials.encode()).decode('utf-8')
 
-    headers = {'Authorization': 'Basic ' + token}
+def auth_headers():
+    """Authorization header for the configured user, encoded once per credential pair."""
+    return {'Authorization': _basic_auth(Config.WORDPRESS_USERNAME, Config.WORDPRESS_PASSWORD)}
 
+
+def _post(endpoint, **kwargs):
+    """POST to a WordPress REST route, recording its latency under `endpoint`."""
+    with REQUEST_SECONDS.time(endpoint=endpoint, status='error') as labels:
+        response = http_client.post(f"{Config.WORDPRESS_URL}/wp-json/{endpoint}", **kwargs)
+        labels['status'] = response.status_code
+    return response
+
+
+def build_post_data(post_data):
     data = {
         "title": post_data['title'],
         "content": post_data['full_text'],
@@ -26,14 +113,19 @@ def post_to_wordpress(post_data):
 
     if 'featured_media' in post_data:
         data['featured_media'] = post_data['featured_media']
+    return data
+
+
+def post_to_wordpress(post_data):
+    """Create a post and return its WordPress id. Raises PublishError on failure."""
+    data = build_post_data(post_data)
 
     try:
-        logger.info(f"Attempting to post to WordPress: {post_data['title']}")
-        logger.debug(f"Post data: {json.dumps(data, indent=2)}")
-        response = requests.post(url, json=data, headers=headers)
+        logger.debug("Attempting to post to WordPress: %s", post_data['title'])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Post data: %s", json.dumps(data, indent=2))
+        response = _post('wp/v2/posts', json=data, headers=auth_headers())
         response.raise_for_status()
-        logger.info(f"Successfully posted: {post_data['title']}")
-        return True
     except requests.exceptions.RequestException as e:
         logger.error(f"Error posting to WordPress: {e}")
         logger.error(
@@ -41,38 +133,222 @@ def post_to_wordpress(post_data):
         )
         logger.error(
             f"Response content: {getattr(e.response, 'text', 'No response')}")
-        return False
+        raise publish_error(e, str(e)) from e
 
+    try:
+        wp_post_id = response.json().get('id')
+    except (ValueError, AttributeError):
+        wp_post_id = None
+    if not wp_post_id:
+        # The post may well exist, so sending it again could duplicate it
+        logger.error(f"WordPress answered {response.status_code} without a post id for: {post_data['title']}")
+        raise PublishError(f"No post id in the {response.status_code} response", retryable=False, uncertain=True)
+    logger.info("Successfully posted: %s", post_data['title'])
+    return wp_post_id
 
-def upload_featured_image(image_url):
-    url = f"{Config.WORDPRESS_URL}/wp-json/wp/v2/media"
 
-    # Create base64 encoded credentials
-    credentials = f"{Config.WORDPRESS_USERNAME}:{Config.WORDPRESS_PASSWORD}"
-    token = base64.b64encode(credentials.encode()).decode('utf-8')
+def post_batch_to_wordpress(posts):
+    """Create up to WORDPRESS_BATCH_SIZE posts in one request to the batch endpoint.
+
+    Returns one entry per post: its WordPress id, or the PublishError it
+    failed with. Returns None when the site has no batch endpoint
+    (WordPress before 5.6), so the caller can post singly. Raises
+    PublishError when the batch as a whole fails; it is uncertain unless
+    WordPress answered with a 4xx or never got the request, since any of
+    the posts may exist.
+    """
+    global _batch_supported
+    if not _batch_supported:
+        return None
+    if len(posts) > Config.WORDPRESS_BATCH_SIZE:
+        raise ValueError(f"At most {Config.WORDPRESS_BATCH_SIZE} posts per batch, got {len(posts)}")
 
-    headers = {
-        "Content-Type": "image/jpeg",
-        "Authorization": f"Basic {token}",
-        "Content-Disposition":
-        f'attachment; filename="{image_url.split("/")[-1]}"'
+    body = {
+        "validation": "normal",
+        "requests": [{"method": "POST", "path": "/wp/v2/posts", "body": build_post_data(post)}
+                     for post in posts],
     }
 
+    logger.info(f"Attempting to post a batch of {len(posts)} to WordPress")
     try:
-        logger.info(f"Attempting to upload featured image: {image_url}")
-        image_response = requests.get(image_url)
-        image_response.raise_for_status()
-        image_data = image_response.content
-
-        response = requests.post(url, data=image_data, headers=headers)
-        response.raise_for_status()
-        logger.info(f"Successfully uploaded featured image: {image_url}")
-        return response.json()['id']
+        response = _post('batch/v1', json=body, headers=auth_headers())
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error uploading featured image: {e}")
-        logger.error(
-            f"Response status code: {getattr(e.response, 'status_code', 'No response')}"
-        )
-        logger.error(
-            f"Response content: {getattr(e.response, 'text', 'No response')}")
+        logger.error(f"Error posting batch to WordPress: {e}")
+        raise publish_error(e, f"Batch request failed: {e}") from e
+    if response.status_code == 404:
+        logger.warning("WordPress batch endpoint not available, falling back to single posts")
+        _batch_supported = False
+        return None
+    if response.status_code >= 400:
+        logger.error(f"Error posting batch to WordPress ({response.status_code}): {response.text}")
+        if response.status_code >= 500:
+            raise PublishError(f"Batch request failed with {response.status_code}",
+                               retryable=False, uncertain=True)
+        raise PublishError(f"Batch request rejected with {response.status_code}",
+                           retryable=response.status_code == 429)
+    try:
+        responses = response.json()['responses']
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"Unreadable batch response from WordPress: {e}")
+        raise PublishError(f"Unreadable batch response: {e}", retryable=False, uncertain=True) from e
+
+    results = []
+    for i, post in enumerate(posts):
+        item = responses[i] if i < len(responses) and isinstance(responses[i], dict) else {}
+        status = item.get('status', 0)
+        item_body = item.get('body') if isinstance(item.get('body'), dict) else {}
+        wp_post_id = item_body.get('id') if 200 <= status < 300 else None
+        if wp_post_id:
+            results.append(wp_post_id)
+            logger.info("Successfully posted: %s", post['title'])
+        elif not status or 200 <= status < 300:
+            # Missing from the reply, or created without telling us its id
+            logger.error(f"No post id for {post['title']} in the batch response")
+            results.append(PublishError("No post id in the batch response", retryable=False, uncertain=True))
+        else:
+            message = item_body.get('message', 'No message')
+            logger.error(f"Error posting to WordPress in batch ({status}): {post['title']}: {message}")
+            results.append(PublishError(f"{status}: {message}", retryable=status == 429, uncertain=status >= 500))
+    return results
+
+
+def get_media_store():
+    """Return the store holding the image URL / content hash -> media id map."""
+    global _media_store
+    if _media_store is None:
+        with _media_store_lock:
+            if _media_store is None:
+                _media_store = ArticleStore()
+    return _media_store
+
+
+@contextmanager
+def _upload_lock(image_url):
+    # Keeps two workers from uploading the same image at the same time
+    with _upload_locks_lock:
+        entry = _upload_locks.setdefault(image_url, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _upload_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _upload_locks[image_url]
+
+
+def detect_image_type(head, header_type, image_url):
+    """Pick the MIME type from magic bytes, then the response header, then the URL."""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    header_type = header_type.split(';')[0].strip().lower()
+    if header_type.startswith('image/'):
+        return header_type
+    guessed, _ = mimetypes.guess_type(urlsplit(image_url).path)
+    return guessed or 'image/jpeg'
+
+
+def image_filename(image_url, content_type):
+    """Name the upload after the URL, with an extension WordPress will accept for its type."""
+    filename = unquote(urlsplit(image_url).path.rstrip('/').split('/')[-1]) or 'image'
+    if mimetypes.guess_type(filename)[0] != content_type:
+        extension = mimetypes.guess_extension(content_type)
+        if extension:
+            filename = os.path.splitext(filename)[0] + extension
+    return filename
+
+
+def download_image(image_url):
+    """Stream an image while hashing it, spilling to a temp file past IMAGE_SPOOL_SIZE.
+
+    Returns (body, sha256, content_type). body is bytes for small images
+    and an open temporary file otherwise; the caller closes it.
+    """
+    digest = hashlib.sha256()
+    chunks, size, spool = [], 0, None
+    head = b''
+    try:
+        with http_client.get(image_url, stream=True) as response:
+            response.raise_for_status()
+            header_type = response.headers.get('Content-Type', '')
+            for chunk in response.iter_content(IMAGE_CHUNK_SIZE):
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                size += len(chunk)
+                if spool is None:
+                    chunks.append(chunk)
+                    if size > IMAGE_SPOOL_SIZE:
+                        spool = tempfile.TemporaryFile()
+                        spool.writelines(chunks)
+                        chunks = None
+                else:
+                    spool.write(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        raise
+
+    if spool is None:
+        body = b''.join(chunks)
+    else:
+        spool.seek(0)
+        body = spool
+    return body, digest.hexdigest(), detect_image_type(head, header_type, image_url)
+
+
+def upload_featured_image(image_url):
+    """Upload an image as WordPress media, or reuse an earlier upload. Returns its id, or None."""
+    if not image_url:
         return None
+    media_store = get_media_store()
+    media_id = media_store.media_for_url(image_url)
+    if media_id:
+        logger.info("Reusing media %s for featured image: %s", media_id, image_url)
+        return media_id
+
+    with _upload_lock(image_url):
+        media_id = media_store.media_for_url(image_url)
+        if media_id:
+            return media_id
+
+        body = None
+        try:
+            logger.debug("Attempting to upload featured image: %s", image_url)
+            body, sha256, content_type = download_image(image_url)
+
+            # Same picture under another URL: link it without uploading again
+            media_id = media_store.media_for_hash(sha256)
+            if media_id:
+                logger.info("Reusing media %s for identical image: %s", media_id, image_url)
+                media_store.add_media(image_url, sha256, media_id)
+                return media_id
+
+            upload, content_type = optimize_image(body, content_type)
+            headers = {
+                **auth_headers(),
+                "Content-Type": content_type,
+                "Content-Disposition":
+                f'attachment; filename="{image_filename(image_url, content_type)}"'
+            }
+            response = _post('wp/v2/media', data=upload, headers=headers)
+            response.raise_for_status()
+            media_id = response.json()['id']
+            media_store.add_media(image_url, sha256, media_id)
+            logger.info("Successfully uploaded featured image: %s", image_url)
+            return media_id
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error uploading featured image: {e}")
+            logger.error(
+                f"Response status code: {getattr(e.response, 'status_code', 'No response')}"
+            )
+            logger.error(
+                f"Response content: {getattr(e.response, 'text', 'No response')}")
+            return None
+        finally:
+            if body is not None and not isinstance(body, bytes):
+                body.close()